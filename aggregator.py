@@ -0,0 +1,338 @@
+import heapq
+
+import numpy as np
+
+INITIAL_ROWS = 64  # WindowAggregator rows allocated up front; doubled as keys arrive
+
+
+def per_second_max(times, speeds):
+    """Bin epoch `times` into whole seconds, keeping the max speed per second.
+
+    Returns (first_second, values) where values[i] is the max speed at
+    first_second + i and idle seconds are 0.
+    """
+    if len(times) == 0:
+        return 0, np.zeros(0)
+    secs = np.floor(times).astype(np.int64)
+    first = int(secs.min())
+    values = np.zeros(int(secs.max()) - first + 1)
+    np.maximum.at(values, secs - first, speeds)
+    return first, values
+
+
+def per_second_sum(times, speeds):
+    """Like per_second_max, but adds up the speeds that share a second."""
+    if len(times) == 0:
+        return 0, np.zeros(0)
+    secs = np.floor(times).astype(np.int64)
+    first = int(secs.min())
+    values = np.zeros(int(secs.max()) - first + 1)
+    np.add.at(values, secs - first, speeds)
+    return first, values
+
+
+PER_SECOND = {"max": per_second_max, "sum": per_second_sum}
+
+
+def downsample_minmax(x, y, max_points):
+    """Reduce (x, y) to at most `max_points` points, keeping each bucket's min and max.
+
+    Points stay in their original order, so spikes and dips survive at any
+    zoom level the image can show.
+    """
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    buckets = max(1, max_points // 2)
+    size = -(-n // buckets)
+    padded = np.empty(buckets * size, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    rows = padded.reshape(buckets, size)
+    base = np.arange(buckets) * size
+    lo = base + rows.argmin(axis=1)
+    hi = base + rows.argmax(axis=1)
+    idx = np.minimum(np.sort(np.stack([lo, hi], axis=1), axis=1).ravel(), n - 1)
+    return x[idx], y[idx]
+
+
+class SpaceSaving:
+    """Approximate top-K of a stream in at most `capacity` counters (Space-Saving).
+
+    A new key arriving when all counters are taken replaces the smallest
+    one and inherits its count as `error`, so a value is never
+    under-estimated and every key above total / capacity is kept. With
+    `combine="max"` the counters keep the largest value seen instead of
+    the sum (e.g. peak Mbps).
+    """
+    def __init__(self, capacity, combine="sum"):
+        self.capacity = capacity
+        self.combine = combine
+        self._counts = {}  # key -> [value, error]
+        self._heap = []    # (value when pushed, key); values only grow, so a stale entry is low
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def add(self, key, value):
+        """Count `value` for `key`; returns the key evicted to make room, if any."""
+        counts = self._counts
+        entry = counts.get(key)
+        evicted = None
+        if entry is None:
+            error = 0.0
+            if len(counts) >= self.capacity:
+                evicted, error = self._pop_min()
+            entry = counts[key] = [error, error]
+            heapq.heappush(self._heap, (error, key))
+        if self.combine == "sum":
+            entry[0] += value
+        elif value > entry[0]:
+            entry[0] = value
+        return evicted
+
+    def _pop_min(self):
+        counts = self._counts
+        heap = self._heap
+        while True:
+            value, key = heap[0]
+            current = counts[key][0]
+            if current == value:
+                heapq.heappop(heap)
+                del counts[key]
+                self.evicted += 1
+                return key, value
+            heapq.heapreplace(heap, (current, key))
+
+    def get(self, key):
+        entry = self._counts.get(key)
+        return entry[0] if entry is not None else 0.0
+
+    def top(self, k):
+        """[(key, value, error)] for the `k` largest counters, largest first."""
+        items = heapq.nlargest(k, self._counts.items(), key=lambda item: item[1][0])
+        return [(key, value, error) for key, (value, error) in items]
+
+    def clear(self):
+        self._counts.clear()
+        self._heap = []
+        self.evicted = 0
+
+
+class WindowAggregator:
+    """Per-key, per-second traffic over a sliding window, in preallocated arrays.
+
+    Keys are interned into row ids. Each row holds a ring of one-second
+    columns: float32 max speed for the chart (or the sum with
+    `combine="sum"`) and the float64 speed sum for the ranking, so a data
+    point costs 12 bytes and no Python objects. `advance` zeroes the
+    columns that fell out of the window for all keys at once and subtracts
+    them from the running totals. Rows are released once nothing of theirs
+    is left in the window and reused for new keys.
+
+    With `capacity`, at most that many keys hold a row. A new key evicts
+    the one with the smallest window total, Space-Saving style: it inherits
+    that total as an over-estimate for ranking, which expires with the
+    second it joined, and the evicted key's speeds move to a cold column
+    ring so speed_since() still counts them.
+    """
+    def __init__(self, window_seconds, top_k, combine="max", capacity=None):
+        self.window_seconds = window_seconds
+        self.top_k = top_k
+        self.combine = combine
+        self.capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def add(self, key, timestamp, speed):
+        sec = int(timestamp)
+        if self._start is None:
+            self._start = sec - self.window_seconds
+        elif sec < self._start:
+            return
+        elif sec > self._start + self.window_seconds:
+            self.advance(sec)
+
+        row = self._rows.get(key)
+        if row is None:
+            row = self._insert(key, sec, speed)
+        else:
+            self._pending_rows.append(row)
+            self._pending_totals.append(speed)
+        self._pending_cells.append(row * self._ring + sec % self._ring)
+        self._pending_speeds.append(speed)
+        self._pending_keys.add(row)
+
+    def _flush(self):
+        """Apply the speeds buffered by add() to the arrays in one vectorized step."""
+        if not self._pending_cells:
+            return
+        cells = np.array(self._pending_cells)
+        speeds = np.array(self._pending_speeds)
+        if self.combine == "sum":
+            np.add.at(self._values.reshape(-1), cells, speeds)
+        else:
+            np.maximum.at(self._values.reshape(-1), cells, speeds)
+        np.add.at(self._sums.reshape(-1), cells, speeds)
+        np.add.at(self._totals, np.array(self._pending_rows, dtype=np.int64), self._pending_totals)
+        self._pending_cells = []
+        self._pending_speeds = []
+        self._pending_rows = []
+        self._pending_totals = []
+        self._pending_keys.clear()
+
+    def advance(self, now):
+        """Slide the window so it ends at `now` (epoch seconds)."""
+        start = int(now) - self.window_seconds
+        if self._start is None:
+            self._start = start
+            return
+        if start <= self._start:
+            return
+        self._flush()
+        old_start = self._start
+        self._start = start
+        if not self._rows:
+            self._cold[:] = 0
+            return
+
+        cols = [sec % self._ring for sec in range(old_start, min(start, old_start + self._ring))]
+        self._totals -= self._sums[:, cols].sum(axis=1)
+        self._sums[:, cols] = 0
+        self._values[:, cols] = 0
+        self._cold[cols] = 0
+
+        expired = self._active & (self._error_sec < start)
+        self._totals[expired] -= self._errors[expired]
+        self._errors[expired] = 0
+
+        # Keys with nothing left in the window give their row back
+        idle = self._active & ~self._sums.any(axis=1) & (self._errors == 0)
+        for row in np.nonzero(idle)[0].tolist():
+            self._release(row)
+
+    def top(self):
+        """The `top_k` keys with the highest speed sum in the window, highest first."""
+        self._flush()
+        rows = np.nonzero(self._active)[0]
+        if not len(rows):
+            return []
+        totals = self._totals[rows]
+        if len(rows) > self.top_k:
+            best = np.argpartition(-totals, self.top_k - 1)[:self.top_k]
+            rows, totals = rows[best], totals[best]
+        return [self._keys[row] for row in rows[np.argsort(-totals, kind="stable")].tolist()]
+
+    def total(self, key):
+        self._flush()
+        row = self._rows.get(key)
+        return float(self._totals[row]) if row is not None else 0.0
+
+    def series(self, key, start_sec, end_sec):
+        """Max (or summed) speed per second for `key` over [start_sec, end_sec] as an array, 0 where idle."""
+        self._flush()
+        values = np.zeros(end_sec - start_sec + 1)
+        row = self._rows.get(key)
+        if row is None:
+            return values
+        secs = np.arange(max(start_sec, self._start), min(end_sec, self._start + self.window_seconds) + 1)
+        values[secs - start_sec] = self._values[row, secs % self._ring]
+        return values
+
+    def speed_since(self, sec):
+        """Sum of the speeds recorded at or after `sec`."""
+        if self._start is None:
+            return 0.0
+        self._flush()
+        cols = np.arange(max(sec, self._start), self._start + self.window_seconds + 1) % self._ring
+        return float(self._sums[:, cols].sum() + self._cold[cols].sum())
+
+    def cold_total(self):
+        """Speed sum over the window of the keys evicted from the hot set."""
+        self._flush()
+        return float(self._cold.sum())
+
+    def clear(self):
+        self._ring = self.window_seconds + 1
+        self._rows = {}      # key -> row
+        self._keys = []      # row -> key (None while free)
+        self._free = []
+        self._values = np.zeros((0, self._ring), dtype=np.float32)  # max (or summed) speed per second
+        self._sums = np.zeros((0, self._ring))      # speed sum per second
+        self._totals = np.zeros(0)                  # speed sum over the window (inf for free rows)
+        self._errors = np.zeros(0)                  # total inherited on eviction
+        self._error_sec = np.zeros(0, dtype=np.int64)
+        self._active = np.zeros(0, dtype=bool)
+        self._cold = np.zeros(self._ring)           # speed sum of evicted keys per second
+        self._pending_cells = []   # row * ring + column of each add() not yet applied
+        self._pending_speeds = []
+        self._pending_rows = []    # rows whose total is behind, and by how much
+        self._pending_totals = []
+        self._pending_keys = set()  # rows with buffered cells
+        self._start = None   # oldest second kept
+        self.evicted = 0
+
+    def _insert(self, key, sec, speed):
+        if self.capacity is not None and len(self._rows) >= self.capacity:
+            inherited = self._evict_min()
+        else:
+            inherited = 0.0
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        self._rows[key] = row
+        self._keys[row] = key
+        self._active[row] = True
+        # A new key's total is exact right away, so it is not mistaken for the smallest
+        self._totals[row] = inherited + speed
+        self._errors[row] = inherited
+        if inherited:
+            self._error_sec[row] = sec
+        return row
+
+    def _grow(self):
+        self._flush()
+        old = len(self._keys)
+        size = max(INITIAL_ROWS, 2 * old)
+        if self.capacity is not None:
+            size = min(size, self.capacity)
+        extra = size - old
+        self._values = np.vstack([self._values, np.zeros((extra, self._ring), dtype=np.float32)])
+        self._sums = np.vstack([self._sums, np.zeros((extra, self._ring))])
+        self._totals = np.concatenate([self._totals, np.full(extra, np.inf)])
+        self._errors = np.concatenate([self._errors, np.zeros(extra)])
+        self._error_sec = np.concatenate([self._error_sec, np.zeros(extra, dtype=np.int64)])
+        self._active = np.concatenate([self._active, np.zeros(extra, dtype=bool)])
+        self._keys.extend([None] * extra)
+        self._free.extend(range(size - 1, old - 1, -1))
+
+    def _evict_min(self):
+        """Drop the key with the smallest window total; returns that total."""
+        row = int(self._totals.argmin())
+        if row in self._pending_keys:
+            # Buffered keys can look smaller than they are, and their row must not be reused before the flush
+            self._flush()
+            row = int(self._totals.argmin())
+        total = float(self._totals[row])
+        self._cold += self._sums[row]
+        self._release(row)
+        self.evicted += 1
+        return total
+
+    def _release(self, row):
+        del self._rows[self._keys[row]]
+        self._keys[row] = None
+        self._values[row] = 0
+        self._sums[row] = 0
+        self._totals[row] = np.inf
+        self._active[row] = False
+        self._free.append(row)
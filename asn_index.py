@@ -0,0 +1,279 @@
+"""Offline IP -> ASN/ISP lookup backed by a memory-mapped sorted range index.
+
+Source datasets are either iptoasn-style range tables
+(``range_start  range_end  AS_number  country_code  AS_description``, TSV or
+CSV) or MaxMind-style CIDR tables (``network,autonomous_system_number,
+autonomous_system_organization``). They are compiled once into a compact
+binary file of sorted, non-overlapping ranges which is then mmap'ed, so
+loading is instant and each lookup is a binary search.
+
+Usage:
+    python asn_index.py build ip2asn-combined.tsv
+    python asn_index.py lookup ip2asn-combined.tsv.idx 8.8.8.8 2001:4860::8888
+"""
+import argparse
+import csv
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+MAGIC = b"ASNIDX01"
+HEADER = struct.Struct("<8sB3xIIII")
+INDEX_SUFFIX = ".idx"
+IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def _u32_array(values=()):
+    arr = array("I", values)
+    if arr.itemsize != 4:
+        arr = array("L", values)
+    return arr
+
+
+def _pad8(n):
+    return (8 - n % 8) % 8
+
+
+def load_ranges(source_path):
+    """Yield (version, start, end, org) tuples from a CSV/TSV ASN dataset."""
+    with open(source_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        first = f.readline()
+        delimiter = "\t" if "\t" in first else ","
+        f.seek(0)
+        reader = csv.reader(f, delimiter=delimiter)
+        for row in reader:
+            if not row or row[0].startswith("#"):
+                continue
+            try:
+                if "/" in row[0]:
+                    network = ipaddress.ip_network(row[0].strip(), strict=False)
+                    start, end = network.network_address, network.broadcast_address
+                    asn = row[1].strip()
+                    org = row[2].strip() if len(row) > 2 else ""
+                else:
+                    start = ipaddress.ip_address(row[0].strip())
+                    end = ipaddress.ip_address(row[1].strip())
+                    asn = row[2].strip() if len(row) > 2 else ""
+                    org = row[-1].strip() if len(row) > 3 else ""
+            except ValueError:
+                # Header line or malformed row
+                continue
+
+            if start.version != end.version or asn in ("", "0"):
+                continue
+            if not org or org == "Not routed":
+                org = f"AS{asn}"
+            yield start.version, int(start), int(end), org
+
+
+def build_index(source_path, index_path=None):
+    """Compile `source_path` into a binary index and return its path."""
+    index_path = index_path or source_path + INDEX_SUFFIX
+
+    ranges = {4: [], 6: []}
+    for version, start, end, org in load_ranges(source_path):
+        ranges[version].append((start, end, org))
+
+    org_ids = {}
+    orgs = []
+
+    def org_id(name):
+        idx = org_ids.get(name)
+        if idx is None:
+            idx = org_ids[name] = len(orgs)
+            orgs.append(name)
+        return idx
+
+    tables = {}
+    for version, items in ranges.items():
+        items.sort()
+        starts, ends, ids = [], [], []
+        last_end = -1
+        for start, end, org in items:
+            # Overlapping rows: the earlier range wins
+            start = max(start, last_end + 1)
+            if start > end:
+                continue
+            starts.append(start)
+            ends.append(end)
+            ids.append(org_id(org))
+            last_end = end
+        tables[version] = (starts, ends, ids)
+
+    org_blob = bytearray()
+    org_offsets = _u32_array([0])
+    for name in orgs:
+        org_blob += name.encode("utf-8")
+        org_offsets.append(len(org_blob))
+
+    v4_starts, v4_ends, v4_ids = tables[4]
+    v6_starts, v6_ends, v6_ids = tables[6]
+    byteorder = 0 if sys.byteorder == "little" else 1
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, byteorder, len(v4_starts), len(v6_starts), len(orgs), len(org_blob)))
+        sections = [
+            _u32_array(v4_starts).tobytes(),
+            _u32_array(v4_ends).tobytes(),
+            _u32_array(v4_ids).tobytes(),
+            b"".join(v.to_bytes(16, "big") for v in v6_starts),
+            b"".join(v.to_bytes(16, "big") for v in v6_ends),
+            _u32_array(v6_ids).tobytes(),
+            org_offsets.tobytes(),
+            bytes(org_blob),
+        ]
+        for section in sections:
+            f.write(section)
+            f.write(b"\x00" * _pad8(len(section)))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class _FixedWidthKeys:
+    """Sequence view over fixed-width big-endian keys, for bisect."""
+    def __init__(self, view, width):
+        self._view = view
+        self._width = width
+        self._len = len(view) // width
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._len
+        w = self._width
+        return self._view[i * w:(i + 1) * w].tobytes()
+
+
+class AsnIndex:
+    """Memory-mapped IPv4/IPv6 range index; `lookup` is O(log n)."""
+    def __init__(self, index_path):
+        self.path = index_path
+        self._file = open(index_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, byteorder, n4, n6, n_orgs, blob_len = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{index_path} is not an ASN index")
+        native = byteorder == (0 if sys.byteorder == "little" else 1)
+
+        offset = HEADER.size
+        sections = []
+        for size in (4 * n4, 4 * n4, 4 * n4, 16 * n6, 16 * n6, 4 * n6, 4 * (n_orgs + 1), blob_len):
+            sections.append(view[offset:offset + size])
+            offset += size + _pad8(size)
+
+        def u32(section):
+            if native:
+                return section.cast("I")
+            # Index built on a machine with the other byte order: copy once
+            arr = _u32_array()
+            arr.frombytes(section.tobytes())
+            arr.byteswap()
+            return arr
+
+        self._v4_starts = u32(sections[0])
+        self._v4_ends = u32(sections[1])
+        self._v4_orgs = u32(sections[2])
+        self._v6_starts = _FixedWidthKeys(sections[3], 16)
+        self._v6_ends = _FixedWidthKeys(sections[4], 16)
+        self._v6_orgs = u32(sections[5])
+        self._org_offsets = u32(sections[6])
+        self._org_blob = sections[7]
+        self._org_names = {}
+
+    @classmethod
+    def open(cls, path):
+        """Open a compiled index, or compile a CSV/TSV dataset (cached next to it)."""
+        with open(path, "rb") as f:
+            is_index = f.read(len(MAGIC)) == MAGIC
+        if is_index:
+            return cls(path)
+
+        index_path = path + INDEX_SUFFIX
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+            build_index(path, index_path)
+        return cls(index_path)
+
+    def __len__(self):
+        return len(self._v4_starts) + len(self._v6_starts)
+
+    def lookup(self, ip):
+        """Return the ISP/AS name for `ip`, or None if it is not covered."""
+        if not ip:
+            return None
+        ip = ip.strip("[]")
+        try:
+            if ":" in ip:
+                packed = socket.inet_pton(socket.AF_INET6, ip)
+                if packed[:12] != IPV4_MAPPED_PREFIX:
+                    i = bisect_right(self._v6_starts, packed) - 1
+                    if i >= 0 and packed <= self._v6_ends[i]:
+                        return self._org_name(self._v6_orgs[i])
+                    return None
+                key = int.from_bytes(packed[12:], "big")
+            else:
+                key = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+        except OSError:
+            return None
+
+        i = bisect_right(self._v4_starts, key) - 1
+        if i >= 0 and key <= self._v4_ends[i]:
+            return self._org_name(self._v4_orgs[i])
+        return None
+
+    def close(self):
+        # Drop the views before closing the mmap they point into
+        for name in ("_v4_starts", "_v4_ends", "_v4_orgs", "_v6_starts", "_v6_ends",
+                     "_v6_orgs", "_org_offsets", "_org_blob"):
+            self.__dict__.pop(name, None)
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def _org_name(self, idx):
+        name = self._org_names.get(idx)
+        if name is None:
+            start, end = self._org_offsets[idx], self._org_offsets[idx + 1]
+            name = self._org_names[idx] = self._org_blob[start:end].tobytes().decode("utf-8")
+        return name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an offline ASN index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="compile a CSV/TSV dataset into an index")
+    build.add_argument("source")
+    build.add_argument("-o", "--output", default=None)
+
+    lookup = sub.add_parser("lookup", help="look up IP addresses")
+    lookup.add_argument("index")
+    lookup.add_argument("ips", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        path = build_index(args.source, args.output)
+        index = AsnIndex(path)
+        print(f"Built {path}: {len(index)} ranges")
+        index.close()
+    else:
+        index = AsnIndex.open(args.index)
+        for ip in args.ips:
+            print(f"{ip}\t{index.lookup(ip) or '-'}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""Benchmarks for the ingest, render and export hot paths.
+
+Generates synthetic CDP event streams and reports, as JSON:
+  - ingest: events/s through the attach_tab handlers
+  - latency: record-to-aggregate latency with events paced at --rate
+  - frames: update_plot / update_chart time on the offscreen Qt platform
+  - exports: PNG and Excel export time per table size
+  - store: SQLite store write rate, top-K and range query time
+  - startup: time from launching the GUI to its first shown window, in a
+    fresh interpreter, and which deferred modules were loaded by then
+
+ISP lookups are answered by a local stub and the record log goes to a
+temporary directory, so no network access or real data is touched.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --only ingest latency --rate 5000 --ips 2000 --domains 300
+    python benchmark.py --only exports --export-sizes 10000 100000 1000000
+    python benchmark.py --only store --store-records 1000000
+    python benchmark.py --only startup --max-startup-ms 1500
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import collector
+from cdp_capture import ReplayTab
+from isp_resolver import IspCache, IspResolver
+from record_log import JsonlSink, RecordWriter
+from record_store import RECORD_DTYPE, RecordTable
+
+SUITES = ("ingest", "latency", "frames", "exports", "store", "startup")
+# Modules the live view must not need: export backends, the ISP HTTP client and the CDP transports
+DEFERRED_MODULES = ("matplotlib", "openpyxl", "requests", "pychrome", "websockets")
+
+# Run in a fresh interpreter: import the GUI, run collector.startup() on
+# throwaway files and show the window offscreen, then print the timings
+STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import network_monitor
+import collector
+imported = time.perf_counter()
+workdir = sys.argv[1]
+collector.OUTPUT_FILE = os.path.join(workdir, "responses.jsonl")
+collector.RECORD_STORE_FILE = os.path.join(workdir, "responses.nmrec")
+collector.STORE_FILE = os.path.join(workdir, "traffic.sqlite")
+collector.ISP_CACHE_FILE = os.path.join(workdir, "isp_cache.json")
+collector.SKETCH_DIR = os.path.join(workdir, "sketches")
+collector.startup()
+started = time.perf_counter()
+from pyqtgraph.Qt import QtWidgets
+app = QtWidgets.QApplication(sys.argv[:1])
+window = network_monitor.NetworkMonitorApp()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(json.dumps({
+    "shown_at": time.time(),
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "window_ms": (shown - started) * 1000,
+    "loaded": [name for name in sys.argv[2:] if name in sys.modules],
+}))
+collector.shutdown()
+"""
+
+
+def stub_isp(ip):
+    return f"Bench ISP {ip.rsplit('.', 1)[0]}"
+
+
+def make_sizes(rng, dist, count):
+    """Response sizes in bytes, all above the handlers' 7 KB cut-off unless `dist` says otherwise."""
+    if dist == "fixed":
+        return [100_000] * count
+    if dist == "uniform":
+        return [rng.randint(5_000, 1_000_000) for _ in range(count)]
+    # lognormal: median ~50 KB with a long tail of large responses
+    return [int(rng.lognormvariate(10.8, 1.5)) for _ in range(count)]
+
+
+def generate_requests(count, ips, domains, size_dist, seed=1):
+    """Synthetic requests as (request id, url, ip, size, duration) tuples."""
+    rng = random.Random(seed)
+    ip_pool = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(ips)]
+    domain_pool = [f"site{i}.example.com" for i in range(domains)]
+    sizes = make_sizes(rng, size_dist, count)
+    return [
+        (f"bench-{i}", f"https://{rng.choice(domain_pool)}/asset/{i}", rng.choice(ip_pool), sizes[i], rng.uniform(0.02, 2.0))
+        for i in range(count)
+    ]
+
+
+def emit_request(listeners, request, monotonic, walltime):
+    request_id, url, ip, size, duration = request
+    listeners["Network.requestWillBeSent"](
+        requestId=request_id,
+        request={"url": url, "headers": {}},
+        timestamp=monotonic,
+        walltime=walltime
+    )
+    listeners["Network.responseReceived"](requestId=request_id, response={"remoteIPAddress": ip})
+    listeners["Network.loadingFinished"](requestId=request_id, encodedDataLength=size, timestamp=monotonic + duration)
+
+
+def setup_collector(workdir):
+    """Point the collector at a stub ISP backend and a throwaway record log, instead of collector.startup()."""
+    collector.isp_resolver = IspResolver(IspCache(os.path.join(workdir, "isp_cache.json")), stub_isp, workers=2)
+    collector.SKETCH_DIR = os.path.join(workdir, "sketches")
+    collector.record_writer = RecordWriter(
+        JsonlSink(os.path.join(workdir, "responses.jsonl")),
+        batch_size=collector.LOG_BATCH_SIZE,
+        flush_interval=collector.LOG_FLUSH_INTERVAL
+    )
+
+
+def new_tab(name):
+    tab = ReplayTab(name)
+    collector.attach_tab(tab)
+    return tab.listeners
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3)
+    }
+
+
+def bench_ingest(args):
+    collector.reset_session()
+    requests = generate_requests(args.requests, args.ips, args.domains, args.sizes)
+    listeners = new_tab("bench-ingest")
+    now = time.time()
+
+    start = time.perf_counter()
+    for i, request in enumerate(requests):
+        emit_request(listeners, request, 1000 + i * 0.001, now)
+    elapsed = time.perf_counter() - start
+
+    events = len(requests) * 3
+    return {
+        "requests": len(requests),
+        "events": events,
+        "records": len(collector.record_queue),
+        "seconds": round(elapsed, 4),
+        "events_per_s": round(events / elapsed),
+        "us_per_event": round(elapsed / events * 1e6, 3)
+    }
+
+
+def bench_latency(args):
+    collector.reset_session()
+    count = int(args.rate * args.duration)
+    requests = generate_requests(count, args.ips, args.domains, args.sizes, seed=2)
+    listeners = new_tab("bench-latency")
+    done = threading.Event()
+
+    def feed():
+        start = time.monotonic()
+        for i, request in enumerate(requests):
+            delay = start + i / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            emit_request(listeners, request, time.monotonic(), time.time())
+        done.set()
+
+    latencies = []
+    feeder = threading.Thread(target=feed, name="bench-feeder", daemon=True)
+    feeder.start()
+    frame = collector.DRAIN_BATCH_SIZE
+    while not done.is_set() or len(collector.record_queue):
+        time.sleep(0.05)
+        records = collector.consume_records(frame)
+        now = time.time()
+        latencies.extend((now - record.timestamp) * 1000 for record in records)
+    feeder.join()
+
+    return {
+        "rate": args.rate,
+        "records": len(latencies),
+        "dropped": collector.record_queue.dropped,
+        "poll_interval_ms": 50,
+        "latency_ms": percentiles(latencies)
+    }
+
+
+def bench_frames(args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import network_monitor
+    from pyqtgraph.Qt import QtWidgets
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    collector.reset_session()
+    window = network_monitor.NetworkMonitorApp()
+    window.timer.stop()
+
+    chart_times = []
+    update_chart = window.update_chart
+
+    def timed_update_chart(*a, **k):
+        start = time.perf_counter()
+        update_chart(*a, **k)
+        chart_times.append((time.perf_counter() - start) * 1000)
+    window.update_chart = timed_update_chart
+
+    rng = random.Random(3)
+    ip_pool = [f"10.0.{i >> 8 & 255}.{i & 255}" for i in range(args.ips)]
+    domain_pool = [f"site{i}.example.com" for i in range(args.domains)]
+
+    def push(count, timestamp):
+        for _ in range(count):
+            collector.record_queue.push(collector.TrafficRecord(
+                timestamp, 100.0, 0.1, rng.uniform(1, 100), rng.choice(ip_pool), rng.choice(domain_pool), "Bench ISP"
+            ))
+
+    # Fill the rolling window first
+    now = time.time()
+    per_second = int(args.rate)
+    for sec in range(collector.ROLLING_SECONDS, 0, -1):
+        push(per_second, now - sec)
+    window.update_plot()
+    app.processEvents()
+
+    per_frame = max(1, per_second // 20)
+    frame_times = []
+    chart_times.clear()
+    for _ in range(args.frames):
+        push(per_frame, time.time())
+        start = time.perf_counter()
+        window.update_plot()
+        frame_times.append((time.perf_counter() - start) * 1000)
+        app.processEvents()
+
+    window.close()
+    return {
+        "frames": args.frames,
+        "records_per_frame": per_frame,
+        "window_records": per_second * collector.ROLLING_SECONDS,
+        "update_plot_ms": percentiles(frame_times),
+        "update_chart_ms": percentiles(chart_times)
+    }
+
+
+def synthetic_table(count, ips, domains, rate, seed=4):
+    rng = np.random.default_rng(seed)
+    strings = [""] + [f"10.0.{i >> 8 & 255}.{i & 255}" for i in range(ips)] + [f"site{i}.example.com" for i in range(domains)]
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    records["time"] = time.time() - count / rate + np.sort(rng.uniform(0, count / rate, count))
+    records["size_kb"] = rng.lognormal(3.9, 1.5, count)
+    records["duration_s"] = rng.uniform(0.02, 2.0, count)
+    records["speed_mbps"] = records["size_kb"] * 8 / 1000 / records["duration_s"]
+    records["ip"] = rng.integers(1, ips + 1, count)
+    records["domain"] = rng.integers(ips + 1, ips + domains + 1, count)
+    return RecordTable(records, strings)
+
+
+def bench_exports(args, workdir):
+    from excel_export import write_excel_report
+    from plot_export import render_traffic_png
+    import network_monitor
+
+    results = []
+    for size in args.export_sizes:
+        table = synthetic_table(size, args.ips, args.domains, args.rate)
+
+        start = time.perf_counter()
+        render_traffic_png(table, os.path.join(workdir, f"bench_{size}.png"), network_monitor.line_colors(collector.NUM_LINES), collector.NUM_LINES, stub_isp)
+        png_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        write_excel_report(table, os.path.join(workdir, f"bench_{size}.xlsx"))
+        excel_seconds = time.perf_counter() - start
+
+        results.append({
+            "records": size,
+            "png_seconds": round(png_seconds, 3),
+            "excel_seconds": round(excel_seconds, 3),
+            "excel_records_per_s": round(size / excel_seconds)
+        })
+        print(f"exports: {size} records done", file=sys.stderr)
+    return results
+
+
+def bench_store(args, workdir):
+    from timeseries_store import TimeSeriesStore
+
+    store = TimeSeriesStore(os.path.join(workdir, "bench.sqlite"))
+    rng = random.Random(5)
+    ip_pool = [f"10.0.{i >> 8 & 255}.{i & 255}" for i in range(args.ips)]
+    domain_pool = [f"site{i}.example.com" for i in range(args.domains)]
+    count = args.store_records
+    start_time = time.time() - count / args.rate
+
+    written = 0
+    write_seconds = 0.0
+    batch_size = collector.LOG_BATCH_SIZE
+    for offset in range(0, count, batch_size):
+        batch = [
+            collector.TrafficRecord(
+                start_time + i / args.rate, rng.uniform(10, 5000), 0.1, rng.uniform(1, 100),
+                rng.choice(ip_pool), rng.choice(domain_pool), "Bench ISP"
+            )
+            for i in range(offset, min(offset + batch_size, count))
+        ]
+        begin = time.perf_counter()
+        written += store.write_batch(batch)
+        write_seconds += time.perf_counter() - begin
+
+    end_time = start_time + count / args.rate
+    queries = {}
+    for name, query in (
+        ("top_domain_ms", lambda: store.top("domain", start_time, end_time, collector.NUM_LINES)),
+        ("top_ip_peak_ms", lambda: store.top("ip", start_time, end_time, collector.NUM_LINES, by="peak")),
+        ("series_ms", lambda: store.series("domain", domain_pool[0], start_time, end_time)),
+        ("read_table_ms", lambda: store.read_table(start_time, end_time)),
+    ):
+        begin = time.perf_counter()
+        query()
+        queries[name] = round((time.perf_counter() - begin) * 1000, 2)
+    store.close()
+
+    return {
+        "records": written,
+        "span_s": round(end_time - start_time),
+        "records_per_s": round(written / write_seconds),
+        **queries
+    }
+
+
+def bench_startup(args, workdir):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for run in range(args.startup_runs):
+        run_dir = os.path.join(workdir, f"startup_{run}")
+        os.makedirs(run_dir)
+        launched = time.time()
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE, run_dir, *DEFERRED_MODULES],
+            cwd=here, env=env, capture_output=True, text=True, timeout=120
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"startup probe failed: {result.stderr.strip()}")
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        probe["window_shown_ms"] = (probe.pop("shown_at") - launched) * 1000
+        runs.append(probe)
+
+    return {
+        "runs": len(runs),
+        "window_shown_ms": percentiles([probe["window_shown_ms"] for probe in runs]),
+        "import_ms": percentiles([probe["import_ms"] for probe in runs]),
+        "startup_ms": percentiles([probe["startup_ms"] for probe in runs]),
+        "window_ms": percentiles([probe["window_ms"] for probe in runs]),
+        "deferred_modules_loaded": sorted({name for probe in runs for name in probe["loaded"]})
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest, render and export paths")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--requests", type=int, default=100_000, help="requests fed to the ingest benchmark")
+    parser.add_argument("--rate", type=float, default=2000, help="requests per second for latency, frames and export time spans")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of paced traffic for the latency benchmark")
+    parser.add_argument("--ips", type=int, default=500, help="distinct IPs")
+    parser.add_argument("--domains", type=int, default=100, help="distinct domains")
+    parser.add_argument("--sizes", choices=("lognormal", "uniform", "fixed"), default="lognormal", help="response size distribution")
+    parser.add_argument("--frames", type=int, default=200, help="frames rendered by the frame benchmark")
+    parser.add_argument("--export-sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--store-records", type=int, default=200_000, help="records written by the store benchmark")
+    parser.add_argument("--startup-runs", type=int, default=5, help="GUI launches timed by the startup benchmark")
+    parser.add_argument("--max-startup-ms", type=float, default=None,
+                        help="exit with status 1 if the median time to the shown window is above this, or a deferred module was loaded")
+    parser.add_argument("--output", default=None, help="write results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="nm-bench-") as workdir:
+        setup_collector(workdir)
+        results = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": {k: v for k, v in vars(args).items() if k != "output"},
+        }
+        if "ingest" in args.only:
+            results["ingest"] = bench_ingest(args)
+        if "latency" in args.only:
+            results["latency"] = bench_latency(args)
+        if "frames" in args.only:
+            results["frames"] = bench_frames(args)
+        if "exports" in args.only:
+            results["exports"] = bench_exports(args, workdir)
+        if "store" in args.only:
+            results["store"] = bench_store(args, workdir)
+        if "startup" in args.only:
+            results["startup"] = bench_startup(args, workdir)
+        collector.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    startup = results.get("startup")
+    if args.max_startup_ms is not None and startup is not None:
+        median = startup["window_shown_ms"]["p50"]
+        if median > args.max_startup_ms or startup["deferred_modules_loaded"]:
+            print(f"Startup over budget: {median:.0f} ms (max {args.max_startup_ms:.0f} ms), "
+                  f"deferred modules loaded: {', '.join(startup['deferred_modules_loaded']) or 'none'}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Single-connection asyncio CDP transport.
+
+Every target is reached through a flattened session on the browser
+websocket, so all tabs, iframes and workers are served by one event loop
+in one thread instead of two pychrome threads per tab. Incoming events are
+dispatched straight to the listeners registered on a SessionTab, which
+offers the same start/call_method/set_listener surface as pychrome.Tab so
+collector.attach_tab works unchanged.
+
+Requires the optional `websockets` package, imported when a client runs.
+"""
+import asyncio
+import importlib.util
+import itertools
+import json
+
+
+def available():
+    return importlib.util.find_spec("websockets") is not None
+
+
+class SessionTab:
+    """A flattened CDP session that looks like a pychrome.Tab to the handlers.
+
+    call_method only queues the command (responses are not awaited), which
+    is all the handlers need and keeps the event loop from blocking.
+    """
+    def __init__(self, client, session_id, target_id, type):
+        self.client = client
+        self.session_id = session_id
+        self.id = target_id
+        self.type = type
+        self.listeners = {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.client.send("Target.detachFromTarget", {"sessionId": self.session_id})
+
+    def call_method(self, method, **params):
+        self.client.send(method, params, self.session_id)
+
+    def set_listener(self, event, callback):
+        self.listeners[event] = callback
+
+
+class AsyncCdpClient:
+    """Attach to every matching target of one browser over a single websocket.
+
+    `attach(tab)` is called for each new session and `detach(target_id)`
+    when it goes away; both run on the event loop thread.
+    """
+    def __init__(self, http_url, attach, detach, target_types):
+        self.http_url = http_url.rstrip("/")
+        self.attach = attach
+        self.detach = detach
+        self.target_types = target_types
+        self._ids = itertools.count(1)
+        self._pending = {}   # message id -> future
+        self._sessions = {}  # session id -> SessionTab
+        self._outbox = None
+        self._loop = None
+
+    def send(self, method, params=None, session_id=None):
+        """Queue a command without waiting for its result (any thread)."""
+        message = {"id": next(self._ids), "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        self._post(message)
+        return message["id"]
+
+    async def call(self, method, params=None, session_id=None):
+        """Send a command and wait for its result (event loop thread)."""
+        future = self._loop.create_future()
+        message_id = next(self._ids)
+        self._pending[message_id] = future
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        self._outbox.put_nowait(json.dumps(message))
+        return await future
+
+    def _post(self, message):
+        data = json.dumps(message)
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            if asyncio.get_running_loop() is loop:
+                self._outbox.put_nowait(data)
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(self._outbox.put_nowait, data)
+
+    async def run(self, stop):
+        """Serve the browser until its websocket closes or `stop()` returns True."""
+        try:
+            import websockets
+        except ImportError:  # optional dependency
+            raise RuntimeError("the asyncio transport needs the 'websockets' package")
+        import requests
+
+        self._loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue()
+
+        version = await self._loop.run_in_executor(
+            None, lambda: requests.get(f"{self.http_url}/json/version", timeout=2).json()
+        )
+        async with websockets.connect(version["webSocketDebuggerUrl"], max_size=None, ping_interval=None) as ws:
+            writer = asyncio.create_task(self._write(ws))
+            reader = asyncio.create_task(self._read(ws))
+            try:
+                await self.call("Target.setDiscoverTargets", {"discover": True})
+                while not reader.done():
+                    if stop():
+                        break
+                    await asyncio.wait({reader}, timeout=1)
+            finally:
+                writer.cancel()
+                reader.cancel()
+                for future in self._pending.values():
+                    future.cancel()
+                self._pending.clear()
+                for tab in list(self._sessions.values()):
+                    self.detach(tab.id)
+                self._sessions.clear()
+
+    async def _write(self, ws):
+        while True:
+            data = await self._outbox.get()
+            await ws.send(data)
+
+    async def _read(self, ws):
+        sessions = self._sessions
+        async for raw in ws:
+            message = json.loads(raw)
+            method = message.get("method")
+            if method is None:
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message.get("result", {}))
+                continue
+
+            session_id = message.get("sessionId")
+            if session_id is not None:
+                tab = sessions.get(session_id)
+                if tab is None:
+                    continue
+                listener = tab.listeners.get(method)
+                if listener is not None:
+                    # One bad event must not end the read loop for every tab
+                    try:
+                        listener(**message.get("params", {}))
+                    except Exception as e:
+                        print(f"Fail to handle {method}: {e}")
+                elif method == "Target.attachedToTarget":
+                    self._attached(message["params"])
+                elif method == "Target.detachedFromTarget":
+                    self._detached(message["params"])
+                continue
+
+            params = message.get("params", {})
+            if method == "Target.targetCreated":
+                info = params.get("targetInfo", {})
+                # iframes and dedicated workers arrive through their parent's auto-attach
+                if info.get("type") in self.target_types and info.get("type") not in ("iframe", "worker"):
+                    self.send("Target.attachToTarget", {"targetId": info["targetId"], "flatten": True})
+            elif method == "Target.attachedToTarget":
+                self._attached(params)
+            elif method == "Target.detachedFromTarget":
+                self._detached(params)
+
+    def _attached(self, params):
+        session_id = params["sessionId"]
+        info = params.get("targetInfo", {})
+        target_id = info.get("targetId")
+        already = any(tab.id == target_id for tab in self._sessions.values())
+        if info.get("type") not in self.target_types or already:
+            if params.get("waitingForDebugger"):
+                self.send("Runtime.runIfWaitingForDebugger", None, session_id)
+            self.send("Target.detachFromTarget", {"sessionId": session_id})
+            return
+
+        tab = SessionTab(self, session_id, target_id, info.get("type"))
+        self._sessions[session_id] = tab
+        self.attach(tab)
+        # Children (OOPIF iframes, workers) are paused until their listeners are in place
+        self.send("Target.setAutoAttach", {"autoAttach": True, "waitForDebuggerOnStart": True, "flatten": True}, session_id)
+        if params.get("waitingForDebugger"):
+            self.send("Runtime.runIfWaitingForDebugger", None, session_id)
+
+    def _detached(self, params):
+        tab = self._sessions.pop(params.get("sessionId"), None)
+        if tab is not None:
+            self.detach(tab.id)
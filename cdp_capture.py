@@ -0,0 +1,178 @@
+"""Capture raw CDP network events and replay them through the collector handlers.
+
+A capture is a JSONL file with one compact event per line:
+    [seconds since capture start, tab id, method, params]
+Only the fields the handlers read are kept. Network.dataReceived is
+always captured, so a capture can be replayed in either ACCOUNTING mode.
+
+Record with the collector (headless or GUI) and replay without Chrome:
+    python collector.py --capture capture.jsonl
+    python collector.py --replay capture.jsonl --speed 10     # 10x, 0 = as fast as possible
+    python network_monitor.py --replay capture.jsonl
+"""
+import json
+import threading
+import time
+
+from record_log import JsonlSink, RecordWriter, iter_log_records
+
+CAPTURED_METHODS = (
+    "Network.requestWillBeSent",
+    "Network.responseReceived",
+    "Network.dataReceived",
+    "Network.loadingFinished",
+    "Network.loadingFailed",
+)
+
+
+def compact_params(method, params):
+    """Keep only the parts of an event's params that the handlers use."""
+    if method == "Network.requestWillBeSent":
+        request = params.get("request", {})
+        headers = request.get("headers", {})
+        referer = headers.get("Referer") or headers.get("referer")
+        return {
+            "requestId": params.get("requestId"),
+            "timestamp": params.get("timestamp"),
+            "walltime": params.get("walltime"),
+            "request": {
+                "url": request.get("url", ""),
+                "headers": {"Referer": referer} if referer else {}
+            }
+        }
+    if method == "Network.responseReceived":
+        response = params.get("response", {})
+        compact = {"remoteIPAddress": response.get("remoteIPAddress", "")}
+        if response.get("fromDiskCache"):
+            compact["fromDiskCache"] = True
+        if response.get("fromMemoryCache"):
+            compact["fromMemoryCache"] = True
+        return {"requestId": params.get("requestId"), "response": compact}
+    if method == "Network.dataReceived":
+        return {
+            "requestId": params.get("requestId"),
+            "timestamp": params.get("timestamp"),
+            "encodedDataLength": params.get("encodedDataLength", 0)
+        }
+    if method == "Network.loadingFinished":
+        return {
+            "requestId": params.get("requestId"),
+            "timestamp": params.get("timestamp"),
+            "encodedDataLength": params.get("encodedDataLength", 0)
+        }
+    return {"requestId": params.get("requestId")}
+
+
+def encode_event(event):
+    return json.dumps(event, separators=(",", ":"))
+
+
+class EventRecorder:
+    """Append CDP events to a capture file from a background writer thread."""
+    def __init__(self, path, max_bytes=0, compress=False):
+        self._start = time.monotonic()
+        self._writer = RecordWriter(JsonlSink(path, max_bytes=max_bytes, compress=compress, encoder=encode_event))
+
+    def record(self, tab_id, method, params):
+        offset = round(time.monotonic() - self._start, 6)
+        self._writer.write([offset, tab_id, method, compact_params(method, params)])
+
+    def segments(self):
+        return self._writer.segments()
+
+    def close(self):
+        self._writer.close()
+
+
+class ReplayTab:
+    """Stand-in for pychrome.Tab that collects listeners instead of talking to Chrome."""
+    def __init__(self, id):
+        self.id = id
+        self.listeners = {}
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def call_method(self, method, **kwargs):
+        return {}
+
+    def set_listener(self, event, callback):
+        self.listeners[event] = callback
+
+
+def iter_events(paths):
+    for event in iter_log_records(paths):
+        if isinstance(event, list) and len(event) == 4:
+            yield event
+
+
+def replay_events(paths, attach, speed=1.0, shift_time=True, stop=None):
+    """Feed captured events through handlers registered by `attach(tab)`.
+
+    `speed` is a multiple of the captured pace; 0 replays as fast as possible.
+    With `shift_time`, request wall times are moved so the capture appears
+    to start now, which keeps it inside the live window, and wall times and
+    monotonic timestamps are both compressed by `speed`, so chunk seconds
+    and durations follow the replay pace. At speed 0 each event is stamped
+    with the time it is replayed.
+    Returns the number of events delivered.
+    """
+    tabs = {}
+    start = time.monotonic()
+    start_wall = time.time()
+    first_walltime = None
+    first_timestamp = None
+    count = 0
+    for offset, tab_id, method, params in iter_events(paths):
+        if stop is not None and stop.is_set():
+            break
+
+        tab = tabs.get(tab_id)
+        if tab is None:
+            tab = tabs[tab_id] = ReplayTab(tab_id)
+            attach(tab)
+
+        if speed > 0:
+            delay = start + offset / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if shift_time:
+            walltime = params.get("walltime")
+            timestamp = params.get("timestamp")
+            if speed > 0:
+                if walltime:
+                    if first_walltime is None:
+                        first_walltime = walltime
+                    params["walltime"] = start_wall + (walltime - first_walltime) / speed
+                if timestamp is not None:
+                    if first_timestamp is None:
+                        first_timestamp = timestamp
+                    params["timestamp"] = first_timestamp + (timestamp - first_timestamp) / speed
+            else:
+                # The captured gaps are not waited for, so they must not reach the timestamps either
+                if walltime:
+                    params["walltime"] = time.time()
+                if timestamp is not None:
+                    params["timestamp"] = time.monotonic()
+
+        listener = tab.listeners.get(method)
+        if listener is not None:
+            listener(**params)
+        count += 1
+    return count
+
+
+def start_replay(paths, attach, speed=1.0, shift_time=True):
+    """Run replay_events on a daemon thread; returns (thread, stop event)."""
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=lambda: print(f"Replayed {replay_events(paths, attach, speed, shift_time, stop)} events"),
+        name="cdp-replay",
+        daemon=True
+    )
+    thread.start()
+    return thread, stop
@@ -0,0 +1,999 @@
+"""Chrome DevTools traffic collector, usable without the Qt UI.
+
+Attaches to every tab of a Chrome started with remote debugging, measures
+each response and hands the records to the log writer and to the in-memory
+queue that a consumer (the GUI in network_monitor.py, or the headless loop
+below) drains.
+
+Importing it opens no files and starts no threads; a consumer calls
+startup() before start_sources() and shutdown() when it is done.
+
+Run headless:
+    python collector.py [--stats-interval 5] [--stats-file stats.log] [--json] [--no-launch]
+                        [--capture capture.jsonl | --replay capture.jsonl [--speed N]]
+                        [--endpoint work=9222 --endpoint test=9223,C:/ChromeTest]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+from aggregator import SpaceSaving, WindowAggregator
+from quantile_sketch import SketchSet, save_sketches
+from asn_index import AsnIndex
+import cdp_async
+from cdp_capture import CAPTURED_METHODS, EventRecorder, start_replay
+from isp_resolver import IspCache, IspResolver, IpinfoBackend
+from metrics import MetricsServer, Registry
+from record_log import JsonlSink, RecordWriter, iter_log_records
+from record_store import BinaryRecordStore, RecordTable
+from timeseries_store import TimeSeriesStore
+
+def get_base_path():
+    """Return the directory where the script/exe is located."""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+
+# ==================== Args ====================
+BASE_DIR = get_base_path()
+OUTPUT_FILE = os.path.join(BASE_DIR, "responses.jsonl")
+ROLLING_SECONDS = 60
+NUM_LINES = 3
+MAX_TRACKED_KEYS = 1000     # IPs / domains with a live per-second series; colder ones are only summarised
+SKETCH_DIR = os.path.join(BASE_DIR, "sketches")  # per-day percentile sketches, merged across sessions
+SKETCH_PENDING_INTERVAL = 1.0  # seconds between passes over the records waiting for their ASN sketch
+RECORD_QUEUE_SIZE = 50000   # records buffered between the CDP listeners and the UI
+DRAIN_BATCH_SIZE = 5000     # max records consumed per UI frame / headless tick
+SAVE_TO_FILE = True         # also append every record to OUTPUT_FILE (used by the exports)
+OUTPUT_FORMAT = "sqlite"    # "sqlite" (STORE_FILE, kept across sessions), "jsonl" (OUTPUT_FILE) or "binary" (RECORD_STORE_FILE, memory-mapped)
+RECORD_STORE_FILE = os.path.join(BASE_DIR, "responses.nmrec")
+STORE_FILE = os.path.join(BASE_DIR, "traffic.sqlite")
+# Seconds of raw records and of each rollup tier kept in STORE_FILE (0 = forever)
+STORE_RETENTION = {"raw": 7 * 24 * 3600, "1s": 24 * 3600, "1m": 90 * 24 * 3600, "1h": 0}
+LOG_BATCH_SIZE = 100        # records per group commit to OUTPUT_FILE
+LOG_FLUSH_INTERVAL = 0.25   # max seconds a record waits before it is written
+LOG_MAX_BYTES = 64 * 1024 * 1024  # rotate OUTPUT_FILE at this size (0 = never)
+LOG_ROTATE_INTERVAL = 0     # rotate OUTPUT_FILE every N seconds (0 = never)
+LOG_COMPRESS = False        # gzip rotated segments
+INFLIGHT_MAX_ENTRIES = 20000  # requests tracked between requestWillBeSent and loadingFinished
+INFLIGHT_TTL = 300            # seconds before an unfinished request is evicted
+ACCOUNTING = "response"  # "response": one record per finished response; "chunks": bytes per second as Network.dataReceived reports them
+TARGET_TYPES = ("page", "iframe", "service_worker", "shared_worker", "worker")  # targets whose traffic is captured
+
+CHROME_PATH = "C:/Program Files/Google/Chrome/Application/chrome.exe"
+DEBUG_PORT = 9222
+CDP_TRANSPORT = "auto"  # "asyncio" (one websocket and thread for all targets, needs websockets), "pychrome" or "auto"
+USER_DATA_DIR = "C:/ChromeDebug"
+DEFAULT_SOURCE = "chrome"
+# Browsers to collect from at once, as (source tag, debug port, user data dir); every record carries its tag
+ENDPOINTS = [(DEFAULT_SOURCE, DEBUG_PORT, USER_DATA_DIR)]
+
+ISP_CACHE_FILE = os.path.join(BASE_DIR, "isp_cache.json")
+ISP_CACHE_TTL = 7 * 24 * 3600
+ISP_RESOLVER_WORKERS = 4
+IPINFO_TOKEN = ""
+# Offline IP-to-ASN dataset (iptoasn TSV or MaxMind ASN CSV); ipinfo.io is only used for misses
+ASN_DATABASE = os.path.join(BASE_DIR, "ip2asn-combined.tsv")
+
+METRICS_PORT = 0  # serve internal metrics at http://127.0.0.1:<port>/metrics (0 = off)
+
+position = 0
+# Chunk records of parallel transfers add up to the link throughput of that second
+ip_traffic = WindowAggregator(ROLLING_SECONDS, NUM_LINES, "sum" if ACCOUNTING == "chunks" else "max", MAX_TRACKED_KEYS)
+domain_traffic = WindowAggregator(ROLLING_SECONDS, NUM_LINES, ip_traffic.combine, MAX_TRACKED_KEYS)  # Slot by domain
+# Session-wide heaviest IPs and domains by KB and by peak Mbps, in bounded memory
+heavy_hitters = {
+    dim: {"bytes": SpaceSaving(MAX_TRACKED_KEYS), "peak": SpaceSaving(MAX_TRACKED_KEYS, "max")}
+    for dim in ("ip", "domain")
+}
+# Duration, speed and size percentiles per IP, domain and ASN, for as many keys as the heavy hitters
+percentile_sketches = SketchSet(MAX_TRACKED_KEYS)
+next_sketch_pending = 0.0
+sketch_save_lock = threading.Lock()  # Clear Data saves on a worker thread
+ip_to_isp_cache = {}
+tab_listeners = {}  # (source, target id) -> tab
+is_monitoring = True
+event_recorder = None  # EventRecorder while capturing raw CDP events
+total_data_transferred = 0
+source_totals = {}  # source -> bytes
+totals_lock = threading.Lock()  # pychrome runs handlers on one thread per tab
+session_start_time = datetime.datetime.now()
+
+metrics = Registry()
+cdp_events = metrics.counter("cdp_events_total", "CDP network events received", ("method",))
+records_filtered = metrics.counter("records_filtered_total", "loadingFinished events dropped, by filter", ("reason",))
+records_accepted = metrics.counter("records_total", "Traffic records produced")
+isp_lookup_seconds = metrics.histogram("isp_lookup_seconds", "Duration of ISP backend lookups")
+frame_seconds = metrics.histogram("frame_seconds", "Time spent in one UI redraw", (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25))
+
+class TrafficRecord:
+    """One measured response, passed in memory from the CDP listeners to the UI."""
+    __slots__ = ("timestamp", "size_kb", "duration_s", "speed_mbps", "ip", "domain", "isp", "source")
+
+    def __init__(self, timestamp, size_kb, duration_s, speed_mbps, ip, domain, isp, source=DEFAULT_SOURCE):
+        self.timestamp = timestamp
+        self.size_kb = size_kb
+        self.duration_s = duration_s
+        self.speed_mbps = speed_mbps
+        self.ip = ip
+        self.domain = domain
+        self.isp = isp
+        self.source = source
+
+    def to_dict(self):
+        return {
+            "time": datetime.datetime.fromtimestamp(self.timestamp).strftime("%H:%M:%S"),
+            "size_kb": self.size_kb,
+            "duration_s": self.duration_s,
+            "speed_mbps": self.speed_mbps,
+            "ip": self.ip,
+            "domain": self.domain,
+            "as": self.isp or "",  # "" while pending, filled in by read_output_table()
+            "source": self.source
+        }
+
+class RecordQueue:
+    """Bounded ring buffer between the tab listener threads and the UI timer.
+
+    deque.append and deque.popleft are atomic in CPython, so the listeners and
+    the single consumer never take a lock. When the buffer is full the oldest
+    record is overwritten and counted in `dropped` (best effort counter).
+    """
+    def __init__(self, maxlen):
+        self._buffer = deque(maxlen=maxlen)
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def push(self, record):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(record)
+
+    def drain(self, max_items):
+        batch = []
+        popleft = self._buffer.popleft
+        try:
+            for _ in range(min(max_items, len(self._buffer))):
+                batch.append(popleft())
+        except IndexError:
+            pass
+        return batch
+
+    def clear(self):
+        self._buffer.clear()
+        self.dropped = 0
+
+def load_asn_index():
+    if not ASN_DATABASE or not os.path.exists(ASN_DATABASE):
+        return None
+    try:
+        return AsnIndex.open(ASN_DATABASE)
+    except Exception as e:
+        print(f"Fail to load ASN database: {e}")
+        return None
+
+class InflightRequest:
+    __slots__ = (
+        "timestamp", "walltime", "domain", "ip", "created",
+        "second", "second_bytes", "second_start", "second_end", "received"
+    )
+
+    def __init__(self, timestamp, walltime, domain, created):
+        self.timestamp = timestamp
+        self.walltime = walltime
+        self.domain = domain
+        self.ip = ""
+        self.created = created
+        # Chunk accounting: only the second being filled is kept, so memory per request is constant
+        self.second = None
+        self.second_bytes = 0
+        # Monotonic span of those bytes: from the last byte of the previous second to the last one so far
+        self.second_start = timestamp
+        self.second_end = timestamp
+        self.received = 0
+
+    def wall_at(self, timestamp):
+        """Epoch time of a CDP monotonic `timestamp` from this request."""
+        if self.walltime and self.timestamp is not None and timestamp is not None:
+            return self.walltime + (timestamp - self.timestamp)
+        return time.time()
+
+    def span(self):
+        """Seconds it took to receive the bytes of the current second."""
+        if self.second_start is None or self.second_end is None:
+            return 1.0
+        # Same floor as a response's duration
+        return max(self.second_end - self.second_start, 0.02)
+
+    def add_bytes(self, second, length, timestamp=None):
+        """Count `length` bytes received at `timestamp` in `second`; returns the (second, bytes, span) it closed, if any."""
+        if self.second is None:
+            self.second = second
+        if second <= self.second:
+            self.second_bytes += length
+            if timestamp is not None:
+                self.second_end = timestamp
+            return None
+        closed = (self.second, self.second_bytes, self.span())
+        self.second = second
+        self.second_bytes = length
+        self.second_start = self.second_end
+        if timestamp is not None:
+            self.second_end = timestamp
+        return closed if closed[1] > 0 else None
+
+    def close_seconds(self, second=None, length=0, timestamp=None):
+        """Add the last `length` bytes at `second` and return every (second, bytes, span) still open."""
+        closed = []
+        if length > 0:
+            done = self.add_bytes(second, length, timestamp)
+            if done is not None:
+                closed.append(done)
+        if self.second is not None and self.second_bytes > 0:
+            closed.append((self.second, self.second_bytes, self.span()))
+        self.second = None
+        self.second_bytes = 0
+        return closed
+
+class InflightTable:
+    """Requests seen by requestWillBeSent that have not finished yet.
+
+    Entries are released on loadingFinished/loadingFailed (or on a cache hit)
+    and evicted when older than `ttl` seconds or beyond `max_entries`, so
+    requests that never complete cannot grow the table without bound.
+    """
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # request_id -> InflightRequest, oldest first
+        self._lock = threading.Lock()
+        self.finished = 0
+        self.failed = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self, request_id, timestamp, walltime, domain):
+        now = time.monotonic()
+        with self._lock:
+            # Redirects reuse the request id, restart the entry
+            self._entries.pop(request_id, None)
+            self._entries[request_id] = InflightRequest(timestamp, walltime, domain, now)
+            self._evict(now)
+
+    def set_ip(self, request_id, ip):
+        with self._lock:
+            entry = self._entries.get(request_id)
+            if entry is not None:
+                entry.ip = ip
+
+    def receive(self, request_id, timestamp, length):
+        """Account a Network.dataReceived chunk; returns (entry, closed second or None)."""
+        with self._lock:
+            entry = self._entries.get(request_id)
+            if entry is None:
+                return None, None
+            entry.received += length
+            return entry, entry.add_bytes(int(entry.wall_at(timestamp)), length, timestamp)
+
+    def finish(self, request_id):
+        with self._lock:
+            entry = self._entries.pop(request_id, None)
+            if entry is not None:
+                self.finished += 1
+            return entry
+
+    def fail(self, request_id):
+        with self._lock:
+            entry = self._entries.pop(request_id, None)
+            if entry is not None:
+                self.failed += 1
+            return entry
+
+    def discard(self, request_id):
+        with self._lock:
+            self._entries.pop(request_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "live": len(self._entries),
+                "finished": self.finished,
+                "failed": self.failed,
+                "evicted": self.evicted
+            }
+
+    def _evict(self, now):
+        entries = self._entries
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evicted += 1
+        deadline = now - self.ttl
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest.created >= deadline:
+                break
+            entries.popitem(last=False)
+            self.evicted += 1
+
+record_queue = RecordQueue(RECORD_QUEUE_SIZE)
+inflight_requests = InflightTable(INFLIGHT_MAX_ENTRIES, INFLIGHT_TTL)
+def make_output_sink():
+    if OUTPUT_FORMAT == "sqlite":
+        return TimeSeriesStore(STORE_FILE, retention=STORE_RETENTION)
+    if OUTPUT_FORMAT == "binary":
+        return BinaryRecordStore(RECORD_STORE_FILE, truncate=True)
+    return JsonlSink(
+        OUTPUT_FILE,
+        max_bytes=LOG_MAX_BYTES,
+        rotate_interval=LOG_ROTATE_INTERVAL,
+        compress=LOG_COMPRESS
+    )
+
+# Set by startup(); importing this module opens no files and starts no threads
+record_writer = None
+isp_resolver = None
+
+def startup():
+    """Open the record log, start its writer thread and load the ISP cache.
+
+    Call once before start_sources(); shutdown() undoes it.
+    """
+    global record_writer, isp_resolver
+    if isp_resolver is not None:
+        return
+    if OUTPUT_FORMAT == "jsonl":
+        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+            pass
+    if SAVE_TO_FILE:
+        record_writer = RecordWriter(
+            make_output_sink(),
+            batch_size=LOG_BATCH_SIZE,
+            flush_interval=LOG_FLUSH_INTERVAL
+        )
+    isp_resolver = IspResolver(
+        IspCache(ISP_CACHE_FILE, ttl=ISP_CACHE_TTL),
+        IpinfoBackend(token=IPINFO_TOKEN or None),
+        workers=ISP_RESOLVER_WORKERS,
+        offline=load_asn_index(),
+        on_lookup=isp_lookup_seconds.observe
+    )
+
+metrics.counter_callback("isp_cache_hits_total", "ISP cache hits", lambda: isp_resolver.cache.hits if isp_resolver else 0)
+metrics.counter_callback("isp_cache_misses_total", "ISP cache misses", lambda: isp_resolver.cache.misses if isp_resolver else 0)
+metrics.gauge("isp_lookups_pending", "ISP lookups in progress", lambda: isp_resolver.pending_count() if isp_resolver else 0)
+metrics.gauge("inflight_requests", "Requests awaiting loadingFinished/loadingFailed", lambda: len(inflight_requests))
+metrics.counter_callback("inflight_evicted_total", "In-flight requests evicted by TTL or capacity", lambda: inflight_requests.evicted)
+metrics.counter_callback("window_keys_evicted_total", "IPs and domains evicted from the live series", lambda: ip_traffic.evicted + domain_traffic.evicted)
+metrics.gauge("tabs_attached", "Tabs with network listeners", lambda: len(tab_listeners))
+metrics.gauge("record_queue_backlog", "Records waiting for the consumer", lambda: len(record_queue))
+metrics.counter_callback("record_queue_dropped_total", "Records overwritten in the full queue", lambda: record_queue.dropped)
+metrics.gauge("writer_backlog", "Records waiting to be written to the log", lambda: record_writer.backlog() if record_writer is not None else 0)
+
+def extract_domain(url):
+    try:
+        parsed = urlparse(url)
+        hostname = parsed.hostname
+        if not hostname:
+            return "unknown"
+        
+        if hostname.startswith("www."):
+            hostname = hostname[4:]
+        
+        return hostname
+    except Exception:
+        return "unknown"
+
+def start_chrome(port=DEBUG_PORT, user_data_dir=USER_DATA_DIR):
+    if not os.path.exists(user_data_dir):
+        os.makedirs(user_data_dir)
+    subprocess.Popen([
+        CHROME_PATH,
+        f'--remote-debugging-port={port}',
+        f'--user-data-dir={user_data_dir}'
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def push_record(wall_time, encoded_length, duration, ip, domain, source=DEFAULT_SOURCE):
+    """Build a TrafficRecord and hand it to the UI queue, the log and the totals."""
+    global total_data_transferred
+    with totals_lock:
+        total_data_transferred += encoded_length
+        source_totals[source] = source_totals.get(source, 0) + encoded_length
+
+    # Interned, so the records waiting in the queue and the writer share one copy of each string
+    record = TrafficRecord(
+        wall_time,
+        round(encoded_length / 1000, 2),
+        round(duration, 3),
+        round(encoded_length * 8 / (1000*1000) / duration, 2),
+        sys.intern(ip),
+        sys.intern(domain),
+        None,
+        source
+    )
+    # ISP stays pending (None) until the resolver pool fills it in
+    isp = isp_resolver.resolve(ip, lambda isp, r=record: setattr(r, "isp", isp))
+    if isp is not None:
+        record.isp = isp
+    record_queue.push(record)
+    records_accepted.inc()
+
+    if record_writer is not None:
+        record_writer.write(record)
+
+def push_seconds(entry, seconds, source):
+    """One record per (second, bytes, span) of a request in chunk accounting."""
+    if entry.domain == "unknown" or entry.ip == "":
+        records_filtered.inc(len(seconds), reason="unknown_domain_or_ip")
+        return
+    for second, size, span in seconds:
+        push_record(second, size, span, entry.ip, entry.domain, source)
+
+def capturing(tab_id, method, handler):
+    """Wrap `handler` so the event is counted and written to the capture file, if one is open."""
+    def listener(**kwargs):
+        cdp_events.inc(method=method)
+        recorder = event_recorder
+        if recorder is not None:
+            recorder.record(tab_id, method, kwargs)
+        handler(**kwargs)
+    return listener
+
+def attach_tab(tab, source=DEFAULT_SOURCE):
+    key = (source, tab.id)
+    if key in tab_listeners:
+        return
+    
+    try:
+        tab.start()
+
+        # Request ids are only unique within one browser
+        def handle_request_will_be_sent(**kwargs):
+            """ Capture Headers（Referer）"""
+            request_id = source, kwargs.get("requestId")
+            request = kwargs.get("request", {})
+            timestamp = kwargs.get("timestamp")
+            walltime = kwargs.get("walltime")
+            
+            headers = request.get("headers", {})
+            referer = headers.get("Referer") or headers.get("referer")
+            
+            if referer:
+                domain = extract_domain(referer)
+            else:
+                url = request.get("url", "")
+                domain = extract_domain(url)
+            
+            inflight_requests.start(request_id, timestamp, walltime, domain)
+
+        def handle_response_received(**kwargs):
+            request_id = source, kwargs.get("requestId")
+            response = kwargs.get("response", {})
+            
+            if response.get("fromDiskCache") or response.get("fromMemoryCache"):
+                inflight_requests.discard(request_id)
+                return
+            
+            ip = response.get("remoteIPAddress", "")
+            inflight_requests.set_ip(request_id, ip)
+
+        def handle_data_received(**kwargs):
+            if ACCOUNTING != "chunks":
+                return
+            try:
+                entry, closed = inflight_requests.receive(
+                    (source, kwargs.get("requestId")), kwargs.get("timestamp"), kwargs.get("encodedDataLength", 0)
+                )
+                if closed is not None:
+                    push_seconds(entry, [closed], source)
+            except Exception as e:
+                records_filtered.inc(reason="error")
+                print(f"Fail to process chunk: {e}")
+
+        def finish_chunks(entry, timestamp, encoded_length):
+            if not entry:
+                records_filtered.inc(reason="no_request")
+                return
+            # Headers and anything dataReceived did not report land in the last second
+            rest = encoded_length - entry.received
+            push_seconds(entry, entry.close_seconds(int(entry.wall_at(timestamp)), rest, timestamp), source)
+
+        def handle_loading_finished(**kwargs):
+            try:
+                request_id = source, kwargs.get("requestId")
+                encoded_length = kwargs.get("encodedDataLength", 0)
+                start_info = inflight_requests.finish(request_id)
+
+                if ACCOUNTING == "chunks":
+                    finish_chunks(start_info, kwargs.get("timestamp"), encoded_length)
+                    return
+                
+                if encoded_length < 7*1000:
+                    records_filtered.inc(reason="too_small")
+                    return
+                
+                if not start_info:
+                    records_filtered.inc(reason="no_request")
+                    return
+                
+                start_timestamp = start_info.timestamp
+                end_timestamp = kwargs.get("timestamp")
+
+                if end_timestamp is None or start_timestamp is None:
+                    records_filtered.inc(reason="no_timestamp")
+                    return
+                
+
+                # time lessthen 0.03 usually not real
+                # TODO: consider tune the time or just ingore the data with time = 0.03
+                # Python had a timestamp limit with 0.01 ~ 0.03 error, so a very small responce will had a very high error rate.
+                duration = end_timestamp - start_timestamp
+                duration = max(duration, 0.02)
+                
+                ip = start_info.ip
+                domain = start_info.domain
+
+                if domain == "unknown" or ip == "":
+                    records_filtered.inc(reason="unknown_domain_or_ip")
+                    return
+                
+                # try to ingore all of the small responce
+                # TODO: make sure if you really want to keep the small data or focus the method.
+                if duration == 0.035:
+                    records_filtered.inc(reason="duration")
+                    return
+                
+                wall_time = start_info.walltime
+                if not wall_time:
+                    wall_time = time.time()
+                
+                push_record(wall_time, encoded_length, duration, ip, domain, source)
+                    
+            except Exception as e:
+                records_filtered.inc(reason="error")
+                print(f"Fail to process response: {e}")
+
+        def handle_loading_failed(**kwargs):
+            entry = inflight_requests.fail((source, kwargs.get("requestId")))
+            # Bytes of an aborted transfer still crossed the link
+            if entry is not None and ACCOUNTING == "chunks":
+                push_seconds(entry, entry.close_seconds(), source)
+
+        handlers = {
+            "Network.requestWillBeSent": handle_request_will_be_sent,
+            "Network.responseReceived": handle_response_received,
+            "Network.dataReceived": handle_data_received,
+            "Network.loadingFinished": handle_loading_finished,
+            "Network.loadingFailed": handle_loading_failed,
+        }
+        for method in CAPTURED_METHODS:
+            tab.set_listener(method, capturing(f"{source}/{tab.id}", method, handlers[method]))
+        tab_listeners[key] = tab
+        
+        # Listeners first, so no event sent right after enabling is dropped
+        tab.call_method("Network.enable")
+        if getattr(tab, "type", None) in (None, "page", "iframe"):
+            tab.call_method("Page.enable")
+    except Exception as e:
+        print(f"Fail to label: {e}")
+
+def detach_tab(source, target_id):
+    tab = tab_listeners.pop((source, target_id), None)
+    if tab is None:
+        return
+    try:
+        tab.stop()
+    except Exception:
+        pass
+
+def target_tab(target_info, port):
+    import pychrome
+
+    target_id = target_info["targetId"]
+    return pychrome.Tab(
+        id=target_id,
+        type=target_info.get("type"),
+        webSocketDebuggerUrl=f"ws://127.0.0.1:{port}/devtools/page/{target_id}"
+    )
+
+def watch_targets(browser, source, port):
+    """Attach to targets as Chrome reports them over the browser endpoint.
+
+    Target.setAutoAttach with waitForDebuggerOnStart holds each new top-level
+    target before it sends anything; it is resumed with
+    Runtime.runIfWaitingForDebugger once its own connection has Network
+    enabled, so its first requests are not missed. Target.setDiscoverTargets
+    replays the existing targets and reports OOPIF iframes, workers and
+    closed targets. A target destroyed while it is being attached is
+    detached as soon as the attach returns. Returns when the browser
+    connection drops.
+    """
+    import pychrome
+
+    endpoint = pychrome.Tab(id="browser", type="browser", webSocketDebuggerUrl=browser.version(timeout=2)["webSocketDebuggerUrl"])
+    attaching = {}  # target id -> auto-attach sessions to resume once its listeners are in place
+    attaching_lock = threading.Lock()
+
+    def resume(session_id):
+        try:
+            # pychrome cannot address a flattened session, so send the raw message
+            endpoint._send({"method": "Runtime.runIfWaitingForDebugger", "params": {}, "sessionId": session_id}, timeout=5)
+            endpoint.call_method("Target.detachFromTarget", sessionId=session_id, _timeout=5)
+        except Exception as e:
+            print(f"Fail to resume target: {e}")
+
+    def run_attach(target_info):
+        target_id = target_info["targetId"]
+        attach_tab(target_tab(target_info, port), source)
+        with attaching_lock:
+            sessions = attaching.pop(target_id, None)
+        if sessions is None:
+            # Destroyed while connecting
+            detach_tab(source, target_id)
+            return
+        for session_id in sessions:
+            if session_id is not None:
+                resume(session_id)
+
+    def attach(target_info, session_id=None):
+        target_id = target_info.get("targetId")
+        with attaching_lock:
+            if target_id in attaching:
+                attaching[target_id].append(session_id)
+                return
+            started = (source, target_id) not in tab_listeners
+            if started:
+                attaching[target_id] = [session_id]
+        if started:
+            # Connecting blocks until the target answers, keep the browser event thread free
+            threading.Thread(target=run_attach, args=(target_info,), daemon=True).start()
+        elif session_id is not None:
+            resume(session_id)
+
+    def handle_target_created(**kwargs):
+        target_info = kwargs.get("targetInfo", {})
+        if target_info.get("type") in TARGET_TYPES:
+            attach(target_info)
+
+    def handle_attached_to_target(**kwargs):
+        target_info = kwargs.get("targetInfo", {})
+        if target_info.get("type") in TARGET_TYPES:
+            attach(target_info, kwargs.get("sessionId"))
+        else:
+            resume(kwargs.get("sessionId"))
+
+    def handle_target_gone(**kwargs):
+        target_id = kwargs.get("targetId")
+        with attaching_lock:
+            # run_attach finds its entry gone and detaches the tab itself
+            if attaching.pop(target_id, None) is not None:
+                return
+        detach_tab(source, target_id)
+
+    endpoint.start()
+    try:
+        endpoint.set_listener("Target.targetCreated", handle_target_created)
+        endpoint.set_listener("Target.attachedToTarget", handle_attached_to_target)
+        endpoint.set_listener("Target.targetDestroyed", handle_target_gone)
+        endpoint.set_listener("Target.targetCrashed", handle_target_gone)
+        endpoint.call_method("Target.setDiscoverTargets", discover=True)
+        endpoint.call_method("Target.setAutoAttach", autoAttach=True, waitForDebuggerOnStart=True, flatten=True)
+        # wait() returns True once the websocket is gone
+        while is_monitoring and not endpoint.wait(1):
+            pass
+    finally:
+        try:
+            endpoint.stop()
+        except Exception:
+            pass
+
+def poll_tabs(browser, source):
+    """Fallback for endpoints without the Target domain: poll /json every 2s."""
+    tabs = browser.list_tab()
+    for tab in tabs:
+        attach_tab(tab, source)
+    current = {tab.id for tab in tabs}
+    for tab_source, target_id in list(tab_listeners):
+        if tab_source == source and target_id not in current:
+            detach_tab(source, target_id)
+
+def watch_targets_async(source, port):
+    """Serve every target over flattened sessions on one websocket, in this thread."""
+    client = cdp_async.AsyncCdpClient(
+        f"http://127.0.0.1:{port}",
+        lambda tab: attach_tab(tab, source),
+        lambda target_id: detach_tab(source, target_id),
+        TARGET_TYPES
+    )
+    asyncio.run(client.run(lambda: not is_monitoring))
+
+def monitor_tabs(source=DEFAULT_SOURCE, port=DEBUG_PORT):
+    """Keep one browser's targets attached, tagging their records with `source`."""
+    import pychrome  # loaded on the monitor thread, not at startup
+
+    browser = pychrome.Browser(url=f"http://127.0.0.1:{port}")
+    use_async = CDP_TRANSPORT == "asyncio" or (CDP_TRANSPORT == "auto" and cdp_async.available())
+    use_targets = True
+    while is_monitoring:
+        try:
+            if use_async:
+                watch_targets_async(source, port)
+            elif use_targets:
+                watch_targets(browser, source, port)
+            else:
+                poll_tabs(browser, source)
+        except pychrome.CallMethodException as e:
+            print(f"Fail to watch targets on {source}, polling tabs instead: {e}")
+            use_targets = False
+        except Exception:
+            pass
+        time.sleep(2)
+
+def read_output_table():
+    """Flush the writer and return every record logged in this session as a RecordTable.
+
+    Records are written as soon as they are measured, so those whose ISP
+    lookup was still pending are stored without one; their ISP is filled in
+    here from the resolver's cache.
+    """
+    if record_writer is None:
+        return RecordTable.from_dicts([])
+    record_writer.flush()
+    if isinstance(record_writer.sink, (BinaryRecordStore, TimeSeriesStore)):
+        table = record_writer.sink.read_table()
+    else:
+        table = RecordTable.from_dicts(iter_log_records(record_writer.segments()))
+    return table.fill_isp(isp_resolver.resolve) if isp_resolver is not None else table
+
+def history_store():
+    """The TimeSeriesStore records are written to, or None for the other output formats."""
+    if record_writer is not None and isinstance(record_writer.sink, TimeSeriesStore):
+        return record_writer.sink
+    return None
+
+def get_isp(ip):
+    """Return the ISP of `ip` without blocking; the IP itself while the lookup is pending."""
+    isp = isp_resolver.resolve(ip)
+    return isp if isp is not None else ip
+
+def consume_records(max_items):
+    """Drain up to `max_items` records from the queue into the window aggregators."""
+    global next_sketch_pending
+    records = record_queue.drain(max_items)
+    for record in records:
+        ip_traffic.add(record.ip, record.timestamp, record.speed_mbps)
+        heavy_hitters["ip"]["bytes"].add(record.ip, record.size_kb)
+        heavy_hitters["ip"]["peak"].add(record.ip, record.speed_mbps)
+
+        if record.domain != "unknown":
+            domain_traffic.add(record.domain, record.timestamp, record.speed_mbps)
+            heavy_hitters["domain"]["bytes"].add(record.domain, record.size_kb)
+            heavy_hitters["domain"]["peak"].add(record.domain, record.speed_mbps)
+        percentile_sketches.add(record)
+    now = time.monotonic()
+    if now >= next_sketch_pending:
+        next_sketch_pending = now + SKETCH_PENDING_INTERVAL
+        percentile_sketches.add_pending(time.time())
+    return records
+
+def session_top(dim, by="bytes", k=NUM_LINES):
+    """[(key, MB)] (or [(key, peak Mbps)] with by="peak") of this session's heaviest IPs or domains."""
+    scale = 1 / 1024 if by == "bytes" else 1
+    return [(key, value * scale) for key, value, _ in heavy_hitters[dim][by].top(k)]
+
+def save_percentile_sketches(background=False):
+    """Merge this session's sketches into the file of the day it started, then start them over.
+
+    With `background`, the file is read and written on a worker thread.
+    """
+    percentile_sketches.add_pending(time.time())
+    if not len(percentile_sketches):
+        return
+    sketches = percentile_sketches.take()
+    path = os.path.join(SKETCH_DIR, f"{session_start_time:%Y-%m-%d}.json")
+
+    def save():
+        with sketch_save_lock:
+            try:
+                os.makedirs(SKETCH_DIR, exist_ok=True)
+                save_sketches(sketches, path)
+            except OSError as e:
+                print(f"Fail to save sketches to {path}: {e}")
+
+    if background:
+        threading.Thread(target=save, name="sketch-save").start()
+    else:
+        save()
+
+def reset_session():
+    global total_data_transferred, session_start_time
+    save_percentile_sketches(background=True)
+    ip_traffic.clear()
+    domain_traffic.clear()
+    for counters in heavy_hitters.values():
+        for sketch in counters.values():
+            sketch.clear()
+    with totals_lock:
+        total_data_transferred = 0
+        source_totals.clear()
+    session_start_time = datetime.datetime.now()
+    record_queue.clear()
+
+    if record_writer is not None:
+        record_writer.clear()
+
+def source_totals_mb():
+    """{source: MB transferred this session}"""
+    with totals_lock:
+        return {source: round(total / (1024 * 1024), 2) for source, total in source_totals.items()}
+
+def start_capture(path):
+    global event_recorder
+    event_recorder = EventRecorder(path, max_bytes=LOG_MAX_BYTES, compress=LOG_COMPRESS)
+
+def start_metrics_server(port=None):
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        return MetricsServer(metrics, port).start()
+    except OSError as e:
+        print(f"Fail to start metrics server: {e}")
+        return None
+
+def metrics_summary():
+    """Short text lines for the diagnostics display."""
+    events = cdp_events.values()
+    event_counts = " / ".join(
+        f"{events.get((method,), 0)}" for method in CAPTURED_METHODS
+    )
+    filtered = ", ".join(f"{reason} {count}" for (reason,), count in sorted(records_filtered.values().items())) or "none"
+    # Before startup() there is no resolver yet
+    hits, misses = (isp_resolver.cache.hits, isp_resolver.cache.misses) if isp_resolver else (0, 0)
+    hit_rate = hits / (hits + misses) * 100 if hits + misses else 0.0
+    return [
+        f"CDP events (request / response / finished / failed): {event_counts}",
+        f"Records: {records_accepted.total()} kept, filtered: {filtered}",
+        f"ISP: cache hit rate {hit_rate:.1f}%, lookup avg {isp_lookup_seconds.mean() * 1000:.0f} ms, "
+        f"p95 <= {isp_lookup_seconds.quantile(0.95) * 1000:.0f} ms, pending {isp_resolver.pending_count() if isp_resolver else 0}",
+        f"In-flight {len(inflight_requests)} (evicted {inflight_requests.evicted}), tabs {len(tab_listeners)}, "
+        f"queue {len(record_queue)} (dropped {record_queue.dropped}), "
+        f"writer backlog {record_writer.backlog() if record_writer is not None else 0}, "
+        f"frame avg {frame_seconds.mean() * 1000:.1f} ms",
+        f"Tracked IPs {len(ip_traffic)} / domains {len(domain_traffic)} of {MAX_TRACKED_KEYS} "
+        f"(evicted {ip_traffic.evicted} / {domain_traffic.evicted}), "
+        f"top by bytes: {', '.join(f'{key} {mb:.1f} MB' for key, mb in session_top('domain', k=3)) or 'none'}"
+    ]
+
+def attach_replay_tab(tab):
+    # Captured tab ids are "<source>/<target id>"; older captures have no source
+    attach_tab(tab, tab.id.rpartition("/")[0] or DEFAULT_SOURCE)
+
+def start_sources(launch_chrome=True, replay=None, speed=1.0, endpoints=None):
+    """Start feeding the handlers: from every browser in `endpoints` (default ENDPOINTS), or from capture files when `replay` is given."""
+    if replay:
+        start_replay(replay, attach_replay_tab, speed)
+        return
+    for source, port, user_data_dir in endpoints or ENDPOINTS:
+        if launch_chrome:
+            threading.Thread(target=start_chrome, args=(port, user_data_dir), daemon=True).start()
+        threading.Thread(target=monitor_tabs, args=(source, port), name=f"monitor-{source}", daemon=True).start()
+
+def shutdown():
+    global is_monitoring, event_recorder
+    is_monitoring = False
+    if event_recorder is not None:
+        event_recorder.close()
+        event_recorder = None
+    if record_writer is not None:
+        record_writer.close()
+    save_percentile_sketches()
+    if isp_resolver is not None:
+        isp_resolver.close()
+
+def format_stats(stats):
+    elapsed = int(stats["elapsed_s"])
+    hours, remainder = divmod(elapsed, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    line = (
+        f"{stats['time']} | current {stats['current_mbps']:.1f} Mbps | peak {stats['peak_mbps']:.1f} Mbps"
+        f" | total {stats['total_mb']:.1f} MB | IPs {stats['active_ips']} | domains {stats['active_domains']}"
+        f" | dropped {stats['dropped']} | {hours:02d}:{minutes:02d}:{seconds:02d}"
+    )
+    if len(stats["sources"]) > 1:
+        line += " | " + ", ".join(f"{source} {mb:.1f} MB" for source, mb in stats["sources"].items())
+    return line
+
+def run_headless(stats_interval=5, stats_file=None, as_json=False, launch_chrome=True, replay=None, speed=1.0, endpoints=None):
+    """Collect without a UI, reporting aggregate throughput every `stats_interval` seconds."""
+    out = open(stats_file, "a", encoding="utf-8") if stats_file else sys.stdout
+    start_sources(launch_chrome, replay, speed, endpoints)
+
+    peak_speed = 0
+    next_report = time.time() + stats_interval
+    try:
+        while True:
+            time.sleep(0.2)
+            consume_records(DRAIN_BATCH_SIZE)
+            now = time.time()
+            ip_traffic.advance(now)
+            domain_traffic.advance(now)
+
+            # Every record is in both dimensions, count it once
+            current_speed = ip_traffic.speed_since(int(now) - 1)
+            peak_speed = max(peak_speed, current_speed)
+
+            if now < next_report:
+                continue
+            next_report += stats_interval
+            stats = {
+                "time": datetime.datetime.fromtimestamp(now).strftime("%H:%M:%S"),
+                "current_mbps": round(current_speed, 2),
+                "peak_mbps": round(peak_speed, 2),
+                "total_mb": round(total_data_transferred / (1024 * 1024), 2),
+                "active_ips": len(ip_traffic),
+                "active_domains": len(domain_traffic),
+                "dropped": record_queue.dropped,
+                "sources": source_totals_mb(),
+                "top_domains_mb": [[key, round(mb, 2)] for key, mb in session_top("domain")],
+                "top_ips_mb": [[key, round(mb, 2)] for key, mb in session_top("ip")],
+                "elapsed_s": round((datetime.datetime.now() - session_start_time).total_seconds(), 1)
+            }
+            out.write((json.dumps(stats) if as_json else format_stats(stats)) + "\n")
+            out.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown()
+        if out is not sys.stdout:
+            out.close()
+
+def parse_endpoint(text):
+    """NAME=PORT[,USER_DATA_DIR] -> (source, port, user data dir)"""
+    name, _, rest = text.partition("=")
+    port, _, user_data_dir = rest.partition(",")
+    try:
+        port = int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME=PORT[,USER_DATA_DIR], got {text!r}")
+    if not name or "/" in name:
+        raise argparse.ArgumentTypeError(f"invalid source name in {text!r}")
+    return name, port, user_data_dir or f"{USER_DATA_DIR}-{name}"
+
+def add_collector_arguments(parser):
+    parser.add_argument("--endpoint", action="append", type=parse_endpoint, default=None, metavar="NAME=PORT[,USER_DATA_DIR]",
+                        help="collect from this browser; repeat for several (default: ENDPOINTS)")
+    parser.add_argument("--capture", default=None, help="also record raw CDP network events to this file")
+    parser.add_argument("--replay", nargs="+", default=None, help="replay captured events instead of attaching to Chrome")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiple, 0 = as fast as possible")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="serve Prometheus metrics on localhost (0 = off)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect Chrome network traffic without the GUI")
+    parser.add_argument("--stats-interval", type=float, default=5, help="seconds between stats lines")
+    parser.add_argument("--stats-file", default=None, help="append stats here instead of stdout")
+    parser.add_argument("--json", action="store_true", help="write stats as JSON lines")
+    parser.add_argument("--no-launch", action="store_true", help="attach to an already running Chrome")
+    add_collector_arguments(parser)
+    args = parser.parse_args(argv)
+    startup()
+    if args.capture:
+        start_capture(args.capture)
+    start_metrics_server(args.metrics_port)
+    run_headless(args.stats_interval, args.stats_file, args.json, not args.no_launch, args.replay, args.speed, args.endpoint)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import datetime
+
+import numpy as np
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+HEADERS = ["Time", "Size (KB)", "Duration (s)", "Speed (Mbps)", "IP", "ISP/AS"]
+QUANTILES = (0.5, 0.9, 0.99)
+PERCENTILE_HEADERS = [
+    f"{name} p{round(q * 100)} ({unit})"
+    for name, unit in (("Speed", "Mbps"), ("Duration", "s"), ("Size", "KB"))
+    for q in QUANTILES
+]
+SUMMARY_HEADERS = ["Domain", "Total Size (MB)", "Avg Speed (Mbps)", "Max Speed (Mbps)", "Request Count"] + PERCENTILE_HEADERS
+SOURCE_HEADERS = ["Source"] + SUMMARY_HEADERS[1:]
+STAT_LABELS = [
+    "Total Size (MB):", "Avg Speed (Mbps):", "Max Speed (Mbps):", "Request Count:",
+    "Speed p50/p90/p99 (Mbps):", "Duration p50/p90/p99 (s):", "Size p50/p90/p99 (KB):"
+]
+MAX_COLUMN_WIDTH = 50
+PROGRESS_EVERY = 5000
+
+
+def _add_styles(wb):
+    border_side = Side(style='thin', color="CCCCCC")
+    border = Border(left=border_side, right=border_side, top=border_side, bottom=border_side)
+    center = Alignment(horizontal="center", vertical="center")
+
+    wb.add_named_style(NamedStyle(
+        name="header",
+        font=Font(bold=True, size=12, color="FFFFFF"),
+        fill=PatternFill(start_color="3498DB", end_color="3498DB", fill_type="solid"),
+        alignment=center,
+        border=border
+    ))
+    wb.add_named_style(NamedStyle(name="cell", alignment=center, border=border))
+    wb.add_named_style(NamedStyle(name="cell_2dp", alignment=center, border=border, number_format='#,##0.00'))
+    wb.add_named_style(NamedStyle(name="cell_3dp", alignment=center, border=border, number_format='0.000'))
+    wb.add_named_style(NamedStyle(name="bold", font=Font(bold=True)))
+
+
+def _styled_cells(ws, styles):
+    """One reusable cell per column; write-only rows are serialized on append."""
+    cells = []
+    for style in styles:
+        cell = WriteOnlyCell(ws)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+
+def _fill(cells, values):
+    for cell, value in zip(cells, values):
+        cell.value = value
+    return cells
+
+
+def _set_widths(ws, lengths):
+    for col_num, length in enumerate(lengths, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = min(length + 2, MAX_COLUMN_WIDTH)
+
+
+def _group_stats(keys, rows, sizes, speeds, durations):
+    """(key id, row indices, total KB, avg speed, max speed, percentiles) per key, largest first.
+
+    Row indices keep their time order within each key. Percentiles are the
+    QUANTILES of speed, duration and size in that order, exact from the rows.
+    """
+    order = rows[np.argsort(keys[rows], kind="stable")]
+    sorted_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    groups = []
+    for key_id, start, count in zip(sorted_keys.tolist(), starts.tolist(), counts.tolist()):
+        idx = order[start:start + count]
+        groups.append((
+            key_id,
+            idx,
+            float(sizes[idx].sum()),
+            float(speeds[idx].sum()) / count,
+            float(speeds[idx].max()),
+            np.concatenate([np.quantile(values[idx], QUANTILES) for values in (speeds, durations, sizes)]).tolist(),
+        ))
+    groups.sort(key=lambda g: g[2], reverse=True)
+    return groups
+
+
+def _round_percentiles(percentiles):
+    """Speed and size percentiles to 2 decimals, durations to 3."""
+    n = len(QUANTILES)
+    return [round(v, 3 if n <= i < 2 * n else 2) for i, v in enumerate(percentiles)]
+
+
+def _write_totals_sheet(wb, title, headers, rows):
+    ws = wb.create_sheet(title=title)
+    ws.freeze_panes = 'A2'
+    lengths = [len(h) for h in headers]
+    for row in rows:
+        lengths = [max(length, len(str(value))) for length, value in zip(lengths, row)]
+    _set_widths(ws, lengths)
+    ws.append(_fill(_styled_cells(ws, ["header"] * len(headers)), headers))
+    percentile_styles = ["cell_2dp"] * len(QUANTILES) + ["cell_3dp"] * len(QUANTILES) + ["cell_2dp"] * len(QUANTILES)
+    cells = _styled_cells(ws, ["cell", "cell_2dp", "cell_2dp", "cell_2dp", "cell"] + percentile_styles)
+    for row in rows:
+        ws.append(_fill(cells, row))
+
+
+def _sheet_title(domain):
+    title = domain[:31]
+    for char in ['\\', '/', '*', '?', ':', '[', ']']:
+        title = title.replace(char, '_')
+    return title
+
+
+def write_excel_report(table, filename, progress=None):
+    """Write the Summary, Sources and per-domain sheets for a RecordTable in one streaming pass.
+
+    Uses a write-only workbook with named styles; column widths are derived
+    from the longest value per column before any row is written.
+    `progress(done, total)` is called every few thousand rows.
+    Returns (domain_count, record_count), or None when there is nothing to export.
+    """
+    records = table.records
+    strings = table.strings
+
+    domain_ids = records["domain"]
+    keep = np.ones(len(records), dtype=bool)
+    if "unknown" in strings:
+        keep = domain_ids != strings.index("unknown")
+    rows = np.nonzero(keep)[0]
+    if not len(rows):
+        return None
+
+    times = records["time"]
+    sizes = records["size_kb"].astype(np.float64)
+    durations = records["duration_s"].astype(np.float64)
+    speeds = records["speed_mbps"].astype(np.float64)
+    ips = records["ip"]
+    isps = records["isp"]
+    sources = records["source"]
+
+    groups = [
+        (strings[domain_id], idx, total_kb, avg_speed, max_speed, percentiles)
+        for domain_id, idx, total_kb, avg_speed, max_speed, percentiles in _group_stats(domain_ids, rows, sizes, speeds, durations)
+    ]
+    source_groups = [g for g in _group_stats(sources, rows, sizes, speeds, durations) if strings[g[0]]]
+    multi_source = len(source_groups) > 1
+    headers = HEADERS + ["Source"] if multi_source else HEADERS
+
+    wb = openpyxl.Workbook(write_only=True)
+    _add_styles(wb)
+
+    _write_totals_sheet(wb, "Summary", SUMMARY_HEADERS, [
+        [domain, round(total_kb / 1024, 2), round(avg_speed, 2), round(max_speed, 2), len(idx)] + _round_percentiles(percentiles)
+        for domain, idx, total_kb, avg_speed, max_speed, percentiles in groups
+    ])
+    if source_groups:
+        _write_totals_sheet(wb, "Sources", SOURCE_HEADERS, [
+            [strings[source_id], round(total_kb / 1024, 2), round(avg_speed, 2), round(max_speed, 2), len(idx)] + _round_percentiles(percentiles)
+            for source_id, idx, total_kb, avg_speed, max_speed, percentiles in source_groups
+        ])
+
+    time_strings = {}
+    total = len(rows)
+    done = 0
+    for domain, idx, total_kb, avg_speed, max_speed, percentiles in groups:
+        ws = wb.create_sheet(title=_sheet_title(domain))
+        ws.freeze_panes = 'A2'
+
+        group_ips = ips[idx]
+        group_isps = isps[idx]
+        ip_len = max((len(strings[i]) for i in np.unique(group_ips).tolist()), default=0)
+        isp_len = max((len(strings[i] or strings[ip]) for ip, i in set(zip(group_ips.tolist(), group_isps.tolist()))), default=0)
+        rounded = _round_percentiles(percentiles)
+        stats = [round(total_kb / 1024, 2), round(avg_speed, 2), round(max_speed, 2), len(idx)] + [
+            " / ".join(str(v) for v in rounded[i:i + len(QUANTILES)]) for i in range(0, len(rounded), len(QUANTILES))
+        ]
+        widths = [
+            max(len(HEADERS[0]), max(len(label) for label in STAT_LABELS)),
+            max(len(HEADERS[1]), len(str(round(float(sizes[idx].max()), 2))), max(len(str(v)) for v in stats)),
+            max(len(HEADERS[2]), len(str(round(float(durations[idx].max()), 3)))),
+            max(len(HEADERS[3]), len(str(round(max_speed, 2)))),
+            max(len(HEADERS[4]), ip_len),
+            max(len(HEADERS[5]), isp_len),
+        ]
+        if multi_source:
+            widths.append(max([len("Source")] + [len(strings[g[0]]) for g in source_groups]))
+        _set_widths(ws, widths)
+
+        ws.append(_fill(_styled_cells(ws, ["header"] * len(headers)), headers))
+        cells = _styled_cells(ws, ["cell", "cell_2dp", "cell_3dp", "cell_2dp", "cell", "cell", "cell"][:len(headers)])
+        for t, size_kb, duration_s, speed, ip, isp, source in zip(
+            times[idx].tolist(), sizes[idx].tolist(), durations[idx].tolist(),
+            speeds[idx].tolist(), group_ips.tolist(), group_isps.tolist(), sources[idx].tolist()
+        ):
+            sec = int(t)
+            time_str = time_strings.get(sec)
+            if time_str is None:
+                time_str = time_strings[sec] = datetime.datetime.fromtimestamp(sec).strftime("%H:%M:%S")
+            ip = strings[ip]
+            ws.append(_fill(cells, (
+                time_str,
+                round(size_kb, 2),
+                round(duration_s, 3),
+                round(speed, 2),
+                ip,
+                strings[isp] or ip,
+                strings[source]
+            )))
+            done += 1
+            if progress is not None and done % PROGRESS_EVERY == 0:
+                progress(done, total)
+
+        ws.append([])
+        label = WriteOnlyCell(ws, value="Statistics:")
+        label.style = "bold"
+        ws.append([label])
+        for name, value in zip(STAT_LABELS, stats):
+            ws.append([name, value])
+
+    wb.save(filename)
+    if progress is not None:
+        progress(total, total)
+    return len(groups), total
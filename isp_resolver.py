@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class IpinfoBackend:
+    """Look up the ISP of an IP through the ipinfo.io JSON API.
+
+    Any callable taking an IP and returning an ISP name (or None) can be used
+    as a backend instead; `base_url` can also point at a local stub server.
+    """
+    def __init__(self, base_url="https://ipinfo.io", token=None, timeout=3):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def __call__(self, ip):
+        import requests  # loaded with the first lookup, off the startup path
+
+        params = {"token": self.token} if self.token else None
+        resp = requests.get(f"{self.base_url}/{ip}/json", params=params, timeout=self.timeout)
+        if resp.status_code != 200:
+            return None
+
+        org = resp.json().get("org")
+        if not org:
+            return None
+        if org.startswith("AS"):
+            parts = org.split(" ", 1)
+            if len(parts) > 1:
+                org = parts[1]
+        return org
+
+
+class IspCache:
+    """IP -> ISP cache with TTL and LRU eviction, persisted as a JSON file."""
+    def __init__(self, path, ttl=7 * 24 * 3600, negative_ttl=600, max_entries=50000):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ip -> (isp, expires_at)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+        entries = data.get("entries", {}) if isinstance(data, dict) else {}
+        with self._lock:
+            for ip, (isp, expires_at) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if expires_at > now:
+                    self._entries[ip] = (isp, expires_at)
+            self._evict()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {ip: [isp, expires_at] for ip, (isp, expires_at) in self._entries.items()}
+            self._dirty = False
+
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Fail to save isp cache: {e}")
+
+    def get(self, ip):
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= time.time():
+                del self._entries[ip]
+                self._dirty = True
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ip)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, ip, isp, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[ip] = (isp, expires_at)
+            self._entries.move_to_end(ip)
+            self._evict()
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class IspResolver:
+    """Resolve ISP names on a background pool without blocking the caller.
+
+    `resolve` answers from the offline index or the cache, or returns None
+    and schedules a backend lookup; concurrent requests for the same IP share
+    a single backend call. `on_lookup(seconds)` is called after every
+    backend call with its duration.
+    """
+    def __init__(self, cache, backend=None, workers=4, save_interval=30, offline=None, on_lookup=None):
+        self.cache = cache
+        self.backend = backend or IpinfoBackend()
+        self.offline = offline
+        self.on_lookup = on_lookup
+        self.save_interval = save_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="isp-resolver")
+        self._pending = {}  # ip -> [callback, ...]
+        self._lock = threading.Lock()
+        self._last_save = time.time()
+
+    def resolve(self, ip, callback=None):
+        """Return the cached ISP for `ip`, or None while it is being looked up.
+
+        `callback(isp)` is called from a worker thread when a pending lookup
+        completes. Failed lookups resolve to the IP itself.
+        """
+        if not ip or ip == "unknown":
+            return "Unknown"
+
+        if self.offline is not None:
+            isp = self.offline.lookup(ip)
+            if isp is not None:
+                return isp
+
+        isp = self.cache.get(ip)
+        if isp is not None:
+            return isp
+
+        with self._lock:
+            waiters = self._pending.get(ip)
+            submit = waiters is None
+            if submit:
+                waiters = self._pending[ip] = []
+            if callback is not None:
+                waiters.append(callback)
+
+        if submit:
+            try:
+                self._pool.submit(self._lookup, ip)
+            except RuntimeError:
+                # Pool already shut down.
+                with self._lock:
+                    self._pending.pop(ip, None)
+        return None
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.cache.save()
+        if self.offline is not None:
+            self.offline.close()
+
+    def _lookup(self, ip):
+        started = time.perf_counter()
+        try:
+            isp = self.backend(ip)
+        except Exception as e:
+            print(f"Fail to get isp {ip}: {e}")
+            isp = None
+        if self.on_lookup is not None:
+            self.on_lookup(time.perf_counter() - started)
+
+        if isp:
+            self.cache.put(ip, isp)
+        else:
+            isp = ip
+            self.cache.put(ip, isp, ttl=self.cache.negative_ttl)
+
+        with self._lock:
+            waiters = self._pending.pop(ip, [])
+        for callback in waiters:
+            try:
+                callback(isp)
+            except Exception as e:
+                print(f"Fail to deliver isp {ip}: {e}")
+
+        if time.time() - self._last_save >= self.save_interval:
+            self._last_save = time.time()
+            self.cache.save()
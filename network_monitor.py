@@ -1,239 +1,49 @@
+import argparse
 import os
-import subprocess
 import time
-import json
 import datetime
-from collections import defaultdict, deque
-import threading
-import requests
-from functools import lru_cache
-from urllib.parse import urlparse
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 
-import pychrome
 import pyqtgraph as pg
 from pyqtgraph.Qt import QtWidgets, QtCore, QtGui
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-
 import sys
 
-def get_base_path():
-    """Return the directory where the script/exe is located."""
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.path.dirname(os.path.abspath(__file__))
+import numpy as np
 
+import collector
+from collector import (
+    BASE_DIR, ROLLING_SECONDS, NUM_LINES, DRAIN_BATCH_SIZE,
+    ip_traffic, domain_traffic, add_collector_arguments, start_capture, start_sources,
+    consume_records, read_output_table, get_isp, reset_session, shutdown,
+    frame_seconds, metrics_summary, source_totals_mb, start_metrics_server, history_store,
+    percentile_sketches, startup
+)
 
 # ==================== Args ====================
-BASE_DIR = get_base_path()
-OUTPUT_FILE = os.path.join(BASE_DIR, "responses.jsonl")
-ROLLING_SECONDS = 60
-UPDATE_INTERVAL = 16
-NUM_LINES = 3
+UPDATE_INTERVAL = 50         # minimum ms between redraws (frame rate cap under load)
+FRAME_BUDGET_FACTOR = 4      # under load, wait at least this many frame times between redraws
 FIXED_COLORS = ['#FF6B6B', "#FFC518", "#EAFA0F"]
-MAX_RECORDS_PER_IP = 1000
-
-CHROME_PATH = "C:/Program Files/Google/Chrome/Application/chrome.exe"
-DEBUG_PORT = 9222
-USER_DATA_DIR = "C:/ChromeDebug"
-
-position = 0
-record_data = defaultdict(lambda: deque(maxlen=MAX_RECORDS_PER_IP))
-domain_record_data = defaultdict(lambda: deque(maxlen=MAX_RECORDS_PER_IP))  # Slot by domain
-ip_to_isp_cache = {}
-tab_listeners = {}
-request_start_times = {}
-request_ips = {}
-request_domains = {}
-is_monitoring = True
-total_data_transferred = 0
-session_start_time = datetime.datetime.now()
-
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    pass
-
-def extract_domain(url):
-    try:
-        parsed = urlparse(url)
-        hostname = parsed.hostname
-        if not hostname:
-            return "unknown"
-        
-        if hostname.startswith("www."):
-            hostname = hostname[4:]
-        
-        return hostname
-    except Exception:
-        return "unknown"
-
-def start_chrome():
-    if not os.path.exists(USER_DATA_DIR):
-        os.makedirs(USER_DATA_DIR)
-    subprocess.Popen([
-        CHROME_PATH,
-        f'--remote-debugging-port={DEBUG_PORT}',
-        f'--user-data-dir={USER_DATA_DIR}'
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+SHOW_DIAGNOSTICS = False     # show the monitor's own metrics under the statistics
+HISTORY_DEBOUNCE_MS = 150    # wait for panning/zooming to settle before loading history
 
-def attach_tab(tab):
-    if tab.id in tab_listeners:
-        return
-    
-    try:
-        tab.start()
-        tab.call_method("Network.enable")
-        tab.call_method("Page.enable")
-
-        def handle_request_will_be_sent(**kwargs):
-            """ Capture Headers（Referer）"""
-            request_id = kwargs.get("requestId")
-            request = kwargs.get("request", {})
-            timestamp = kwargs.get("timestamp")
-            walltime = kwargs.get("walltime")
-
-            request_start_times[request_id] = {
-                'timestamp': timestamp,
-                'walltime': walltime
-            } 
-            
-            headers = request.get("headers", {})
-            referer = headers.get("Referer") or headers.get("referer")
-            
-            if referer:
-                domain = extract_domain(referer)
-            else:
-                url = request.get("url", "")
-                domain = extract_domain(url)
-            
-            request_domains[request_id] = domain
-
-        def handle_response_received(**kwargs):
-            request_id = kwargs.get("requestId")
-            response = kwargs.get("response", {})
-            
-            if response.get("fromDiskCache") or response.get("fromMemoryCache"):
-                return
-            
-            ip = response.get("remoteIPAddress", "")
-            request_ips[request_id] = ip
-
-        def handle_loading_finished(**kwargs):
-            global total_data_transferred
-            try:
-                request_id = kwargs.get("requestId")
-                encoded_length = kwargs.get("encodedDataLength", 0)
-                
-                if encoded_length < 7*1000:
-                    return
-                
-                start_info = request_start_times.get(request_id)
-                if not start_info:
-                    return
-                
-                start_timestamp = start_info['timestamp']
-                end_timestamp = kwargs.get("timestamp")
-
-                if end_timestamp is None or start_timestamp is None:
-                    return
-                
-
-                # time lessthen 0.03 usually not real
-                # TODO: consider tune the time or just ingore the data with time = 0.03
-                # Python had a timestamp limit with 0.01 ~ 0.03 error, so a very small responce will had a very high error rate.
-                duration = end_timestamp - start_timestamp
-                duration = max(duration, 0.02)
-                
-                size_kb = encoded_length / 1000
-                speed_mbps = encoded_length * 8 / (1000*1000) / duration
-                ip = request_ips.get(request_id, "")
-                domain = request_domains.get(request_id, "unknown")
-
-                if domain == "unknown" or ip == "":
-                    return
-                
-                # try to ingore all of the small responce
-                # TODO: make sure if you really want to keep the small data or focus the method.
-                if duration == 0.035:
-                    return
-                
-                total_data_transferred += encoded_length
-
-                wall_time = start_info.get('walltime')
-
-                if wall_time:
-                    actual_time = datetime.datetime.fromtimestamp(wall_time)
-                    time_str = actual_time.strftime("%H:%M:%S")
-                else:
-                    time_str = time.strftime("%H:%M:%S", time.localtime())
-                
-                record = {
-                    "time": time_str,
-                    "size_kb": round(size_kb, 2),
-                    "duration_s": round(duration, 3),
-                    "speed_mbps": round(speed_mbps, 2),
-                    "ip": ip,
-                    "domain": domain,
-                    "as": get_isp(ip)
-                }
-                
-                with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(record) + "\n")
-                    f.flush()
-                    
-            except Exception as e:
-                print(f"Fail to process response: {e}")
-
-        tab.set_listener("Network.requestWillBeSent", handle_request_will_be_sent)
-        tab.set_listener("Network.responseReceived", handle_response_received)
-        tab.set_listener("Network.loadingFinished", handle_loading_finished)
-        tab_listeners[tab.id] = tab
-    except Exception as e:
-        print(f"Fail to label: {e}")
-
-def monitor_tabs():
-    browser = pychrome.Browser(url=f"http://127.0.0.1:{DEBUG_PORT}")
-    while is_monitoring:
-        try:
-            tabs = browser.list_tab()
-            for tab in tabs:
-                attach_tab(tab)
-        except Exception:
-            pass
-        time.sleep(2)
-
-@lru_cache(maxsize=256)
-def get_isp(ip):
-    if not ip or ip == "unknown":
-        return "Unknown"
-    
-    try:
-        url = f"https://ipinfo.io/{ip}/json"
-        resp = requests.get(url, timeout=3)
-        if resp.status_code == 200:
-            data = resp.json()
-            org = data.get("org", ip)
-            if org.startswith("AS"):
-                parts = org.split(" ", 1)
-                if len(parts) > 1:
-                    org = parts[1]
-            return org
-    except Exception as e:
-        print(f"Fail to get isp {ip}: {e}")
-    
-    return ip
+def line_colors(count):
+    """FIXED_COLORS, extended with evenly spaced hues when NUM_LINES asks for more lines."""
+    extra = max(0, count - len(FIXED_COLORS))
+    return FIXED_COLORS[:count] + [pg.intColor(idx, hues=extra).name() for idx in range(extra)]
 
 class SafeTimeAxis(pg.AxisItem):
     def tickStrings(self, values, scale, spacing):
+        if spacing >= 3600:
+            fmt = "%m-%d %H:%M"
+        elif spacing >= 60:
+            fmt = "%H:%M"
+        else:
+            fmt = "%H:%M:%S"
         strs = []
         for v in values:
             try:
                 if isinstance(v, (int, float)) and v > 0:
-                    strs.append(datetime.datetime.fromtimestamp(v).strftime("%H:%M:%S"))
+                    strs.append(datetime.datetime.fromtimestamp(v).strftime(fmt))
                 else:
                     strs.append("")
             except Exception:
@@ -241,8 +51,9 @@ class SafeTimeAxis(pg.AxisItem):
         return strs
 
 class StatisticsPanel(QtWidgets.QWidget):
-    def __init__(self):
+    def __init__(self, show_diagnostics=False):
         super().__init__()
+        self.show_diagnostics = show_diagnostics
         self.init_ui()
         
     def init_ui(self):
@@ -289,6 +100,30 @@ class StatisticsPanel(QtWidgets.QWidget):
             
             layout.addWidget(frame, row, col)
             self.labels[key] = value_label
+        
+        # Per-browser totals, shown once records arrive from more than one source
+        self.sources_label = QtWidgets.QLabel("")
+        self.sources_label.setStyleSheet("color: #ECF0F1; font-size: 20px; padding: 5px;")
+        self.sources_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.sources_label.hide()
+        layout.addWidget(self.sources_label, 2, 0, 1, 3)
+        
+        self.diagnostics_label = None
+        if self.show_diagnostics:
+            self.diagnostics_label = QtWidgets.QLabel("")
+            self.diagnostics_label.setStyleSheet("color: #95A5A6; font-size: 14px; font-family: Consolas, monospace; padding: 5px;")
+            layout.addWidget(self.diagnostics_label, 3, 0, 1, 3)
+    
+    def update_sources(self, totals_mb):
+        if len(totals_mb) < 2:
+            self.sources_label.hide()
+            return
+        self.sources_label.setText("    ".join(f"{source}: {mb:.1f} MB" for source, mb in sorted(totals_mb.items())))
+        self.sources_label.show()
+    
+    def update_diagnostics(self, lines):
+        if self.diagnostics_label is not None:
+            self.diagnostics_label.setText("\n".join(lines))
     
     def update_stats(self, current_speed, peak_speed, total_mb, active_ips, active_domains):
         self.labels["current_speed"].setText(f"{current_speed:.1f} Mbps")
@@ -297,18 +132,70 @@ class StatisticsPanel(QtWidgets.QWidget):
         self.labels["active_ips"].setText(str(active_ips))
         self.labels["active_domains"].setText(str(active_domains))
         
-        elapsed = datetime.datetime.now() - session_start_time
+        elapsed = datetime.datetime.now() - collector.session_start_time
         hours, remainder = divmod(int(elapsed.total_seconds()), 3600)
         minutes, seconds = divmod(remainder, 60)
         self.labels["session_time"].setText(f"{hours:02d}:{minutes:02d}:{seconds:02d}")
 
+class ExportWorker(QtCore.QThread):
+    """Run an export job off the UI thread.
+
+    `job(progress)` returns the completion message (None if there was nothing
+    to export) and may call `progress(text)` to update the status line.
+    """
+    progress = QtCore.Signal(str)
+    succeeded = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.job = job
+
+    def run(self):
+        try:
+            message = self.job(self.progress.emit)
+        except Exception as e:
+            print(f"Fail to export: {e}")
+            self.failed.emit(str(e))
+            return
+        self.succeeded.emit(message)
+
+class HistoryLoader(QtCore.QThread):
+    """Read the IP and domain envelopes of a time range from the store off the UI thread."""
+    loaded = QtCore.Signal(object)
+
+    def __init__(self, store, start, end, width, generation, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.start_time = start
+        self.end_time = end
+        self.width = width
+        self.generation = generation
+
+    def run(self):
+        try:
+            result = {
+                dim: self.store.envelope(dim, self.start_time, self.end_time, self.width, NUM_LINES, ip_traffic.combine)
+                for dim in ("ip", "domain")
+            }
+        except Exception as e:
+            print(f"Fail to load history: {e}")
+            return
+        self.loaded.emit((self.generation, result))
+
 class NetworkMonitorApp(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
-        self.position = 0
+        self.export_workers = []
         self.peak_speed = 0
+        self.last_rendered_sec = None
+        self.frame_time_ms = 0.0
         self.line_labels_ip = [""] * NUM_LINES
         self.line_labels_domain = [""] * NUM_LINES
+        self.history_mode = False
+        self.history_generation = 0
+        self.history_loaders = []
+        self.percentile_labels = {}  # (dim, key) -> legend suffix, refreshed once per second
         self.init_ui()
         
     def init_ui(self):
@@ -355,7 +242,11 @@ class NetworkMonitorApp(QtWidgets.QWidget):
         self.btn_export_excel.clicked.connect(self.export_to_excel)
         self.btn_clear = QtWidgets.QPushButton("Clear Data")
         self.btn_clear.clicked.connect(self.clear_data)
+        self.btn_history = QtWidgets.QPushButton("History")
+        self.btn_history.clicked.connect(self.toggle_history)
+        self.btn_history.setEnabled(history_store() is not None)
         
+        title_layout.addWidget(self.btn_history)
         title_layout.addWidget(self.btn_pause)
         title_layout.addWidget(self.btn_export)
         title_layout.addWidget(self.btn_export_excel)
@@ -363,7 +254,7 @@ class NetworkMonitorApp(QtWidgets.QWidget):
         
         main_layout.addLayout(title_layout)
         
-        self.stats_panel = StatisticsPanel()
+        self.stats_panel = StatisticsPanel(SHOW_DIAGNOSTICS)
         main_layout.addWidget(self.stats_panel)
         
         charts_layout = QtWidgets.QHBoxLayout()
@@ -382,7 +273,7 @@ class NetworkMonitorApp(QtWidgets.QWidget):
         self.plot_ip.addLegend(offset=(5, 5))
         
         self.lines_ip = []
-        for idx, color in enumerate(FIXED_COLORS):
+        for idx, color in enumerate(line_colors(NUM_LINES)):
             line = self.plot_ip.plot([], [], pen=pg.mkPen(color, width=3), name="")
             self.lines_ip.append(line)
         
@@ -402,7 +293,7 @@ class NetworkMonitorApp(QtWidgets.QWidget):
         self.plot_domain.addLegend(offset=(5, 5))
         
         self.lines_domain = []
-        for idx, color in enumerate(FIXED_COLORS):
+        for idx, color in enumerate(line_colors(NUM_LINES)):
             line = self.plot_domain.plot([], [], pen=pg.mkPen(color, width=3), name="")
             self.lines_domain.append(line)
         
@@ -414,6 +305,12 @@ class NetworkMonitorApp(QtWidgets.QWidget):
         self.status_label.setStyleSheet("color: #2ECC71; font-size: 20px; padding: 5px; font-family:Microsoft JhengHei;")
         main_layout.addWidget(self.status_label)
         
+        self.history_timer = QtCore.QTimer()
+        self.history_timer.setSingleShot(True)
+        self.history_timer.setInterval(HISTORY_DEBOUNCE_MS)
+        self.history_timer.timeout.connect(self.load_history)
+        self.plot_ip.sigXRangeChanged.connect(self.history_range_changed)
+        
         self.timer = QtCore.QTimer()
         self.timer.timeout.connect(self.update_plot)
         self.timer.start(UPDATE_INTERVAL)
@@ -430,6 +327,78 @@ class NetworkMonitorApp(QtWidgets.QWidget):
             self.status_label.setText("Monitoring...")
             self.status_label.setStyleSheet("color: #2ECC71; font-size: 20px; padding: 5px; font-family:Microsoft JhengHei;")
     
+    def toggle_history(self):
+        """Switch the charts between the live window and the stored history.
+
+        In history mode both charts share one pannable, zoomable time axis;
+        the statistics keep updating underneath.
+        """
+        if self.history_mode:
+            self.history_mode = False
+            self.history_timer.stop()
+            self.history_generation += 1
+            self.plot_domain.setXLink(None)
+            self.btn_history.setText("History")
+            self.last_rendered_sec = None
+            self.restore_status()
+            return
+        
+        self.history_mode = True
+        self.btn_history.setText("Live")
+        self.plot_domain.setXLink(self.plot_ip)
+        end = time.time()
+        start = min(collector.session_start_time.timestamp(), end - ROLLING_SECONDS)
+        self.plot_ip.setXRange(start, end, padding=0)
+        # setXRange started the debounce timer; load this range once, now
+        self.history_timer.stop()
+        self.load_history()
+    
+    def history_range_changed(self, *args):
+        if self.history_mode:
+            self.history_timer.start()
+    
+    def load_history(self):
+        store = history_store()
+        if not self.history_mode or store is None:
+            return
+        start, end = self.plot_ip.viewRange()[0]
+        self.history_generation += 1
+        loader = HistoryLoader(store, start, end, self.plot_ip.getViewBox().width(), self.history_generation, self)
+        self.history_loaders.append(loader)
+        loader.loaded.connect(self.show_history)
+        loader.finished.connect(lambda: self.history_loaders.remove(loader))
+        self.status_label.setText("Loading history...")
+        loader.start()
+    
+    def show_history(self, result):
+        generation, envelopes = result
+        # Only the latest range is drawn; older loads finishing late are dropped
+        if generation != self.history_generation or not self.history_mode:
+            return
+        targets = (
+            ("ip", self.lines_ip, self.plot_ip, self.line_labels_ip),
+            ("domain", self.lines_domain, self.plot_domain, self.line_labels_domain),
+        )
+        bucket = 1
+        for dim, lines, plot, labels in targets:
+            bucket, series = envelopes[dim]
+            max_value = 1
+            for idx in range(NUM_LINES):
+                if idx < len(series):
+                    key, times, values = series[idx]
+                    lines[idx].setData(times, values)
+                    label = f"{get_isp(key)[:20]} {key}" if dim == "ip" else key[:30]
+                    if len(values):
+                        max_value = max(max_value, float(values.max()) * 1.2)
+                else:
+                    lines[idx].setData([], [])
+                    label = ""
+                if labels[idx] != label:
+                    plot.legend.items[idx][1].setText(label)
+                    labels[idx] = label
+            plot.setYRange(0, max_value)
+        self.status_label.setText(f"History ({bucket} s buckets)")
+    
     def clear_data(self):
         reply = QtWidgets.QMessageBox.question(
             self, 'Confirm', 'Are you sure to clear all data?',
@@ -437,94 +406,88 @@ class NetworkMonitorApp(QtWidgets.QWidget):
         )
         
         if reply == QtWidgets.QMessageBox.Yes:
-            global record_data, domain_record_data, total_data_transferred, session_start_time
-            record_data.clear()
-            domain_record_data.clear()
-            total_data_transferred = 0
-            session_start_time = datetime.datetime.now()
-            self.position = 0
+            reset_session()
             self.peak_speed = 0
-            
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                pass
+            self.last_rendered_sec = None
             
             QtWidgets.QMessageBox.information(self, 'Complete', 'Data cleared')
     
     def update_plot(self):
+        frame_start = time.perf_counter()
         now = datetime.datetime.now()
         
-        try:
-            with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-                f.seek(self.position)
-                lines_read = f.readlines()
-                self.position = f.tell()
-        except FileNotFoundError:
-            return
-        
-        for line in lines_read:
-            try:
-                record = json.loads(line.strip())
-                ip = record.get("ip", "unknown")
-                domain = record.get("domain", "unknown")
-                dt = datetime.datetime.combine(
-                    datetime.date.today(),
-                    datetime.datetime.strptime(record["time"], "%H:%M:%S").time()
-                )
-                data_point = {"time": dt, "speed_mbps": record["speed_mbps"]}
-                
-                record_data[ip].append(data_point)
-                
-                if domain != "unknown":
-                    domain_record_data[domain].append(data_point)
-                    
-            except Exception:
-                continue
+        records = consume_records(DRAIN_BATCH_SIZE)
         
-        if not record_data and not domain_record_data:
+        # Data has one-second resolution: redraw only for new records or a new second
+        current_sec = int(now.timestamp())
+        if not records and current_sec == self.last_rendered_sec:
+            self.schedule_next_frame(now, busy=False)
             return
         
-        window_start = now - datetime.timedelta(seconds=ROLLING_SECONDS)
-        
-        self.update_chart(
-            record_data, 
-            self.lines_ip, 
-            self.plot_ip, 
-            self.line_labels_ip,
-            window_start, 
-            now,
-            use_isp=True
-        )
-        
-        self.update_chart(
-            domain_record_data, 
-            self.lines_domain, 
-            self.plot_domain, 
-            self.line_labels_domain,
-            window_start, 
-            now,
-            use_isp=False
-        )
+        ip_traffic.advance(now.timestamp())
+        domain_traffic.advance(now.timestamp())
+        if current_sec != self.last_rendered_sec:
+            self.percentile_labels.clear()
         
-        total_mb = total_data_transferred / (1024 * 1024)
-        active_ips = len([ip for ip, records in record_data.items() if records])
-        active_domains = len([d for d, records in domain_record_data.items() if records])
+        window_start = now - datetime.timedelta(seconds=ROLLING_SECONDS)
         
-        current_total_speed = 0
-        for records in list(record_data.values()) + list(domain_record_data.values()):
-            if records:
-                latest = records[-1]
-                if latest["time"] >= now - datetime.timedelta(seconds=1):
-                    current_total_speed += latest["speed_mbps"]
+        if not self.history_mode:
+            self.update_chart(
+                ip_traffic, 
+                self.lines_ip, 
+                self.plot_ip, 
+                self.line_labels_ip,
+                window_start, 
+                now,
+                use_isp=True
+            )
+            
+            self.update_chart(
+                domain_traffic, 
+                self.lines_domain, 
+                self.plot_domain, 
+                self.line_labels_domain,
+                window_start, 
+                now,
+                use_isp=False
+            )
+        
+        total_mb = collector.total_data_transferred / (1024 * 1024)
+        active_ips = len(ip_traffic)
+        active_domains = len(domain_traffic)
+        
+        # Every record is in both dimensions, count it once
+        current_total_speed = ip_traffic.speed_since(int(now.timestamp()) - 1)
         
         self.peak_speed = max(self.peak_speed, current_total_speed)
         self.stats_panel.update_stats(current_total_speed, self.peak_speed, total_mb, active_ips, active_domains)
+        
+        if current_sec != self.last_rendered_sec:
+            self.stats_panel.update_sources(source_totals_mb())
+            if self.stats_panel.show_diagnostics:
+                self.stats_panel.update_diagnostics(metrics_summary())
+        
+        self.last_rendered_sec = current_sec
+        elapsed_ms = (time.perf_counter() - frame_start) * 1000
+        frame_seconds.observe(elapsed_ms / 1000)
+        self.frame_time_ms = elapsed_ms if not self.frame_time_ms else 0.8 * self.frame_time_ms + 0.2 * elapsed_ms
+        self.schedule_next_frame(now, busy=bool(records))
     
-    def update_chart(self, data_dict, lines, plot, labels, window_start, now, use_isp=True):
-        total_speeds = {
-            key: sum(r["speed_mbps"] for r in records) 
-            for key, records in data_dict.items()
-        }
-        top_keys = sorted(total_speeds, key=total_speeds.get, reverse=True)[:NUM_LINES]
+    def schedule_next_frame(self, now, busy):
+        if busy:
+            # Keep redraws to at most 1/FRAME_BUDGET_FACTOR of the wall time
+            interval = max(UPDATE_INTERVAL, int(self.frame_time_ms * FRAME_BUDGET_FACTOR))
+        else:
+            # Idle: wake up right after the next second boundary
+            interval = max(UPDATE_INTERVAL, 1000 - now.microsecond // 1000 + 1)
+        if self.timer.interval() != interval:
+            self.timer.setInterval(interval)
+    
+    def update_chart(self, aggregator, lines, plot, labels, window_start, now, use_isp=True):
+        top_keys = aggregator.top()
+        start_sec = int(window_start.timestamp())
+        end_sec = int(now.timestamp())
+        times = np.arange(start_sec, end_sec + 1, dtype=np.float64)
         
         max_value = 1
         
@@ -533,331 +496,132 @@ class NetworkMonitorApp(QtWidgets.QWidget):
             
             if idx < len(top_keys):
                 key = top_keys[idx]
-                
-                data_dict[key] = deque(
-                    [r for r in data_dict[key] if r["time"] >= window_start],
-                    maxlen=MAX_RECORDS_PER_IP
-                )
-                
-                per_second = defaultdict(float)
-                for r in data_dict[key]:
-                    t_sec = int(r["time"].timestamp())
-                    per_second[t_sec] = max(per_second[t_sec], r["speed_mbps"])
-                
-                times = []
-                values = []
-                current = int(window_start.timestamp())
-                end_time = int(now.timestamp())
-                
-                while current <= end_time:
-                    times.append(current)
-                    values.append(per_second.get(current, 0))
-                    current += 1
+                values = aggregator.series(key, start_sec, end_sec)
                 
                 line.setData(times, values)
                 
                 if use_isp:
                     isp_name = get_isp(key)
-                    label = f"{isp_name[:20]} {key}"
+                    label = f"{isp_name[:20]} {key}{self.percentile_label('ip', key)}"
                 else:
-                    label = f"{key[:30]}"
+                    label = f"{key[:30]}{self.percentile_label('domain', key)}"
                 
                 if labels[idx] != label:
                     plot.legend.items[idx][1].setText(label)
                     labels[idx] = label
                 
-                if values:
-                    max_value = max(max_value, max(values) * 1.2)
+                if len(values):
+                    max_value = max(max_value, float(values.max()) * 1.2)
             else:
                 line.setData([], [])
                 if labels[idx] != "":
                     labels[idx] = ""
         
-        plot.setXRange(int(window_start.timestamp()), int(now.timestamp()))
+        plot.setXRange(start_sec, end_sec)
         plot.setYRange(0, max_value)
     
+    def percentile_label(self, dim, key):
+        """Session p50/p90/p99 of speed and duration for a legend entry."""
+        label = self.percentile_labels.get((dim, key))
+        if label is None:
+            speeds = percentile_sketches.quantiles(dim, key, "speed_mbps")
+            durations = percentile_sketches.quantiles(dim, key, "duration_s")
+            label = ""
+            if speeds is not None:
+                label = (
+                    f"  p50/90/99 {'/'.join(f'{v:.1f}' for v in speeds)} Mbps"
+                    f", {'/'.join(f'{v:.2f}' for v in durations)} s"
+                )
+            self.percentile_labels[(dim, key)] = label
+        return label
+    
     def export_full_plot(self):
-        self.timer.stop()
-        
-        full_record_data = defaultdict(list)
-        full_domain_data = defaultdict(list)
-        
-        try:
-            with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        record = json.loads(line.strip())
-                        ip = record.get("ip", "unknown")
-                        domain = record.get("domain", "unknown")
-                        dt = datetime.datetime.combine(
-                            datetime.date.today(),
-                            datetime.datetime.strptime(record["time"], "%H:%M:%S").time()
-                        )
-                        data_point = {"time": dt, "speed_mbps": record["speed_mbps"]}
-                        full_record_data[ip].append(data_point)
-                        if domain != "unknown":
-                            full_domain_data[domain].append(data_point)
-                    except Exception:
-                        continue
-        except FileNotFoundError:
-            QtWidgets.QMessageBox.warning(self, 'Error', 'No data found')
-            self.timer.start()
-            return
-        
-        if not full_record_data and not full_domain_data:
-            QtWidgets.QMessageBox.warning(self, 'Error', 'No data to export')
-            self.timer.start()
-            return
-        
-        plt.style.use('dark_background')
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10))
-        fig.patch.set_facecolor('#1E1E1E')
-        
-        self.plot_export_chart(full_record_data, ax1, "Traffic by IP/ISP", use_isp=True)
-        
-        self.plot_export_chart(full_domain_data, ax2, "Traffic by Domain", use_isp=False)
-        
-        plt.tight_layout()
-        
         filename = os.path.join(BASE_DIR, f"network_traffic_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.png")
-        plt.savefig(filename, dpi=150, facecolor='#1E1E1E')
-        
-        plt.show()
-        QtWidgets.QMessageBox.information(self, 'Complete', f'Saved as: {filename}')
-        self.timer.start()
-    
-    def plot_export_chart(self, data_dict, ax, title, use_isp=True):
-        ax.set_facecolor('#2C3E50')
-        
-        total_speeds = {
-            key: sum(r["speed_mbps"] for r in records) 
-            for key, records in data_dict.items()
-        }
-        top_keys = sorted(total_speeds, key=total_speeds.get, reverse=True)[:NUM_LINES]
-        
-        for idx, key in enumerate(top_keys):
-            records = data_dict[key]
-            per_second = defaultdict(float)
-            
-            for r in records:
-                t_sec = r["time"].replace(microsecond=0)
-                per_second[t_sec] = max(per_second[t_sec], r["speed_mbps"])
-            
-            if not per_second:
-                continue
-            
-            start_time = min(per_second.keys())
-            end_time = max(per_second.keys())
-            times = []
-            values = []
-            current = start_time
-            
-            while current <= end_time:
-                times.append(current)
-                values.append(per_second.get(current, 0))
-                current += datetime.timedelta(seconds=1)
-            
-            if use_isp:
-                isp_name = f"{get_isp(key)} ({key})"
-                label = f"{isp_name}"
-            else:
-                label = f"{key[:25]}"
-            
-            ax.plot(times, values, 
-                   label=label, 
-                   color=FIXED_COLORS[idx % len(FIXED_COLORS)],
-                   linewidth=2)
-        
-        ax.set_xlabel("Time", fontsize=12, color='#ECF0F1')
-        ax.set_ylabel("Mbps", fontsize=12, color='#ECF0F1')
-        ax.set_title(title, fontsize=14, fontweight='bold', color='#3498DB', pad=15)
-        ax.legend(loc='upper left', framealpha=0.9, fontsize=9)
-        ax.grid(True, alpha=0.3, linestyle='--')
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
 
-    def export_to_excel(self):
-        self.timer.stop()
-
-        try:
-            domain_records = defaultdict(list)
-            with open(OUTPUT_FILE, "r", encoding= "utf-8") as f:
-                for line in f:
-                    try:
-                        record = json.loads(line.strip())
-                        domain =  record.get("domain","unknown")
-                        if domain != "unknown":
-                            domain_records[domain].append(record)
-                    except Exception:
-                        continue
-            
-            if not domain_records:
-                QtWidgets.QMessageBox.warning(self,'Error' , 'No data to export')
-                self.timer.start()
-                return
-            
-            wb = openpyxl.Workbook()
-            wb.remove(wb.active)
-            header_font = Font(bold=True, size=12, color="FFFFFF")
-            header_font = Font(bold=True, size=12, color="FFFFFF")
-            header_fill = PatternFill(start_color="3498DB", end_color="3498DB", fill_type="solid")
-            header_alignment = Alignment(horizontal="center", vertical="center")
-        
-            border_side = Side(style='thin', color="CCCCCC")
-            border = Border(left=border_side, right=border_side, top=border_side, bottom=border_side)
-        
-            cell_alignment = Alignment(horizontal="center", vertical="center")
-
-            domain_totals = {domain: sum(r.get("size_kb", 0) for r in records) for domain, records in domain_records.items()}
-            sorted_domains = sorted(domain_totals, key=domain_totals.get, reverse=True)
-            for domain in sorted_domains:
-                records = domain_records[domain]
-
-                sheet_name = domain[:31]
-
-                for char in ['\\', '/', '*', '?', ':', '[', ']']:
-                    sheet_name = sheet_name.replace(char, '_')
-
-                ws = wb.create_sheet(title=sheet_name)
+        def job(progress):
+            # The export backends load on first use, on the worker thread
+            from plot_export import render_traffic_png
 
-                headers = ["Time", "Size (KB)", "Duration (s)", "Speed (Mbps)", "IP", "ISP/AS"]
+            progress("Exporting plot...")
+            if not render_traffic_png(read_output_table(), filename, line_colors(NUM_LINES), NUM_LINES, get_isp, ip_traffic.combine):
+                return None
+            return f'Saved as: {filename}'
 
-                ws.append(headers)
+        self.start_export(job, self.btn_export, 'Complete', 'Export Error')
 
-                for col_num, header in enumerate(headers, 1):
-                    cell = ws.cell(row=1, column=col_num)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = header_alignment
-                    cell.border = border
-
-                for record in records:
-                    row_data = [
-                        record.get("time", ""),
-                        record.get("size_kb", 0),
-                        record.get("duration_s", 0),
-                        record.get("speed_mbps", 0),
-                        record.get("ip", ""),
-                        record.get("as", "")
-                    ]
-                    ws.append(row_data)
-
-                for row_num in range(2, len(records) + 2):
-                    for col_num in range(1, len(headers) + 1):
-                        cell = ws.cell(row=row_num, column=col_num)
-                        cell.alignment = cell_alignment
-                        cell.border = border
-
-                        if col_num == 2:  # Size (KB)
-                            cell.number_format = '#,##0.00'
-                        elif col_num == 3:  # Duration (s)
-                            cell.number_format = '0.000'
-                        elif col_num == 4:  # Speed (Mbps)
-                            cell.number_format = '#,##0.00'
-                
-                stats_row = len(records) + 3
-                ws.cell(row=stats_row, column=1, value="Statistics:").font = Font(bold=True)
-            
-                total_size = sum(r.get("size_kb", 0) for r in records)
-                avg_speed = sum(r.get("speed_mbps", 0) for r in records) / len(records) if records else 0
-                max_speed = max((r.get("speed_mbps", 0) for r in records), default=0)
-            
-                ws.cell(row=stats_row + 1, column=1, value="Total Size (MB):")
-                ws.cell(row=stats_row + 1, column=2, value=round(total_size / 1024, 2))
-            
-                ws.cell(row=stats_row + 2, column=1, value="Avg Speed (Mbps):")
-                ws.cell(row=stats_row + 2, column=2, value=round(avg_speed, 2))
-            
-                ws.cell(row=stats_row + 3, column=1, value="Max Speed (Mbps):")
-                ws.cell(row=stats_row + 3, column=2, value=round(max_speed, 2))
-            
-                ws.cell(row=stats_row + 4, column=1, value="Request Count:")
-                ws.cell(row=stats_row + 4, column=2, value=len(records))
-            
-                for col_num in range(1, len(headers) + 1):
-                    column_letter = get_column_letter(col_num)
-                    max_length = 0
-                    for row in ws.iter_rows(min_col=col_num, max_col=col_num):
-                        for cell in row:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                    adjusted_width = min(max_length + 2, 50)
-                    ws.column_dimensions[column_letter].width = adjusted_width
-                
-                ws.freeze_panes = 'A2'
-
-            summary_ws = wb.create_sheet(title="Summary", index=0)
-            summary_headers = ["Domain", "Total Size (MB)", "Avg Speed (Mbps)", "Max Speed (Mbps)", "Request Count"]
-            summary_ws.append(summary_headers)
-
-            for col_num, header in enumerate(summary_headers, 1):
-                cell = summary_ws.cell(row=1, column=col_num)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-                cell.border = border
-
-            for domain in sorted_domains:
-                records = domain_records[domain]
-                total_size = sum(r.get("size_kb", 0) for r in records) / 1024
-                avg_speed = sum(r.get("speed_mbps", 0) for r in records) / len(records) if records else 0
-                max_speed = max((r.get("speed_mbps", 0) for r in records), default=0)
-            
-                row_data = [
-                    domain,
-                    round(total_size, 2),
-                    round(avg_speed, 2),
-                    round(max_speed, 2),
-                    len(records)
-                ]   
-                summary_ws.append(row_data)
-
-            for row_num in range(2, len(sorted_domains) + 2):
-                for col_num in range(1, len(summary_headers) + 1):
-                    cell = summary_ws.cell(row=row_num, column=col_num)
-                    cell.alignment = cell_alignment
-                    cell.border = border
-                
-                    if col_num in [2, 3, 4]:
-                        cell.number_format = '#,##0.00'
-
-            for col_num in range(1, len(summary_headers) + 1):
-                column_letter = get_column_letter(col_num)
-                max_length = 0
-            
-                for row in summary_ws.iter_rows(min_col=col_num, max_col=col_num):
-                    for cell in row:
-                        try:
-                            if cell.value:
-                                max_length = max(max_length, len(str(cell.value)))
-                        except:
-                            pass
-
-                adjusted_width = min(max_length + 2, 50)
-                summary_ws.column_dimensions[column_letter].width = adjusted_width
+    def export_to_excel(self):
+        filename = os.path.join(BASE_DIR, f"network_traffic_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+
+        def job(progress):
+            from excel_export import write_excel_report
+
+            table = read_output_table()
+            result = write_excel_report(
+                table, filename,
+                progress=lambda done, total: progress(f"Exporting Excel... {done}/{total} records")
+            )
+            if result is None:
+                return None
+            domain_count, record_count = result
+            return f'Data exported successfully!\n\nFile: {filename}\n\nDomains: {domain_count}\nTotal Records: {record_count}'
+
+        self.start_export(job, self.btn_export_excel, 'Export Complete', 'Export Error')
+
+    def start_export(self, job, button, done_title, error_title):
+        """Run `job` on an ExportWorker while monitoring continues."""
+        button.setEnabled(False)
+        self.status_label.setText("Exporting...")
+        worker = ExportWorker(job, self)
+        self.export_workers.append(worker)
+
+        def finish():
+            self.export_workers.remove(worker)
+            button.setEnabled(True)
+            self.restore_status()
+
+        def succeeded(message):
+            finish()
+            if message is None:
+                QtWidgets.QMessageBox.warning(self, 'Error', 'No data to export')
+            else:
+                QtWidgets.QMessageBox.information(self, done_title, message)
 
-            summary_ws.freeze_panes = 'A2'
-            filename = os.path.join(BASE_DIR, f"network_traffic_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-            wb.save(filename)
+        def failed(error):
+            finish()
+            QtWidgets.QMessageBox.critical(self, error_title, f'Failed to export: {error}')
 
-            QtWidgets.QMessageBox.information(self, 'Export Complete', f'Data exported successfully!\n\nFile: {filename}\n\nDomains: {len(sorted_domains)}\nTotal Records: {sum(len(r) for r in domain_records.values())}')
+        worker.progress.connect(self.status_label.setText)
+        worker.succeeded.connect(succeeded)
+        worker.failed.connect(failed)
+        worker.start()
 
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, 'Export Error', f'Failed to export: {str(e)}')
-    
-        finally:
-            self.timer.start()
+    def restore_status(self):
+        if self.timer.isActive():
+            self.status_label.setText("Monitoring...")
+        else:
+            self.status_label.setText("Paused")
 
 if __name__ == "__main__":
-    app = QtWidgets.QApplication([])
+    parser = argparse.ArgumentParser(description="Network traffic monitor")
+    add_collector_arguments(parser)
+    parser.add_argument("--diagnostics", action="store_true", help="show the monitor's own metrics")
+    args = parser.parse_args()
+    if args.diagnostics:
+        SHOW_DIAGNOSTICS = True
+    
+    app = QtWidgets.QApplication(sys.argv[:1])
     app.setStyle('Fusion')
     
-    threading.Thread(target=start_chrome, daemon=True).start()
-    threading.Thread(target=monitor_tabs, daemon=True).start()
+    startup()
+    if args.capture:
+        start_capture(args.capture)
+    start_metrics_server(args.metrics_port)
     
     window = NetworkMonitorApp()
     window.show()
+    # Attach to the browsers once the event loop runs, so the window paints first
+    QtCore.QTimer.singleShot(0, lambda: start_sources(replay=args.replay, speed=args.speed, endpoints=args.endpoint))
     
-    app.exec_()
\ No newline at end of file
+    exit_code = app.exec_()
+    shutdown()
+    sys.exit(exit_code)
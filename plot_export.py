@@ -0,0 +1,102 @@
+import datetime
+
+import numpy as np
+import matplotlib.style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import matplotlib.dates as mdates
+
+from aggregator import PER_SECOND, downsample_minmax
+
+FIGSIZE = (14, 10)
+DPI = 150
+
+
+def plot_export_chart(ax, key_ids, times, speeds, strings, title, colors, top_k, label_for, max_points, combine="max"):
+    ax.set_facecolor('#2C3E50')
+
+    if len(key_ids):
+        total_speeds = np.bincount(key_ids, weights=speeds)
+        top_ids = np.argsort(total_speeds)[::-1][:top_k]
+        top_ids = top_ids[total_speeds[top_ids] > 0]
+    else:
+        top_ids = []
+
+    for idx, key_id in enumerate(top_ids):
+        selected = key_ids == key_id
+        first_sec, values = PER_SECOND[combine](times[selected], speeds[selected])
+
+        if not len(values):
+            continue
+
+        # Local wall-clock seconds as datetime64, matching the live view's time axis
+        utc_offset = datetime.datetime.fromtimestamp(first_sec).astimezone().utcoffset()
+        first_local = first_sec + int(utc_offset.total_seconds())
+        times_axis = np.arange(first_local, first_local + len(values)).astype("datetime64[s]")
+        times_axis, values = downsample_minmax(times_axis, values, max_points)
+
+        ax.plot(times_axis, values,
+                label=label_for(strings[key_id]),
+                color=colors[idx % len(colors)],
+                linewidth=2)
+
+    ax.set_xlabel("Time", fontsize=12, color='#ECF0F1')
+    ax.set_ylabel("Mbps", fontsize=12, color='#ECF0F1')
+    ax.set_title(title, fontsize=14, fontweight='bold', color='#3498DB', pad=15)
+    ax.legend(loc='upper left', framealpha=0.9, fontsize=9)
+    ax.grid(True, alpha=0.3, linestyle='--')
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
+
+
+def source_totals(table):
+    """[(source, MB)] for the tagged sources in a RecordTable, largest first."""
+    records = table.records
+    totals = np.bincount(records["source"], weights=records["size_kb"].astype(np.float64), minlength=1)
+    return sorted(
+        ((table.strings[i], kb / 1024) for i, kb in enumerate(totals.tolist()) if kb > 0 and table.strings[i]),
+        key=lambda item: item[1],
+        reverse=True
+    )
+
+
+def render_traffic_png(table, filename, colors, top_k, isp_label, combine="max"):
+    """Render the IP/ISP and domain charts for a RecordTable to a PNG file.
+
+    Uses an Agg canvas without pyplot, so it can run on a worker thread.
+    Each series is reduced to about one min/max pair per pixel column, after
+    merging the records of each second with `combine` ("max" or "sum").
+    With more than one source browser, their totals go in the figure title.
+    Returns False when there is nothing to export.
+    """
+    records = table.records
+    if not len(records):
+        return False
+
+    times = records["time"]
+    speeds = records["speed_mbps"].astype(np.float64)
+    domain_ids = records["domain"]
+    known = np.ones(len(records), dtype=bool)
+    if "unknown" in table.strings:
+        known = domain_ids != table.strings.index("unknown")
+
+    max_points = 2 * int(FIGSIZE[0] * DPI)
+
+    with matplotlib.style.context('dark_background'):
+        fig = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(fig)
+        fig.patch.set_facecolor('#1E1E1E')
+        ax1, ax2 = fig.subplots(2, 1)
+
+        plot_export_chart(ax1, records["ip"], times, speeds, table.strings, "Traffic by IP/ISP",
+                          colors, top_k, lambda ip: f"{isp_label(ip)} ({ip})", max_points, combine)
+
+        plot_export_chart(ax2, domain_ids[known], times[known], speeds[known], table.strings, "Traffic by Domain",
+                          colors, top_k, lambda domain: domain[:25], max_points, combine)
+
+        sources = source_totals(table)
+        if len(sources) > 1:
+            fig.suptitle("   ".join(f"{source}: {mb:.1f} MB" for source, mb in sources), color='#ECF0F1', fontsize=12)
+
+        fig.tight_layout()
+        fig.savefig(filename, dpi=DPI, facecolor='#1E1E1E')
+    return True
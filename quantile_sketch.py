@@ -0,0 +1,298 @@
+"""Mergeable streaming quantile sketches per IP, domain and ASN.
+
+Each sketch is a log-bucketed histogram (DDSketch style): a value goes to
+bucket ceil(log(value) / log(gamma)), so every quantile is returned within
+RELATIVE_ACCURACY of the true value. An update is one log and one dict
+increment, and two sketches merge by adding their bucket counts, so the
+sketches of several sessions or days combine without the raw records.
+
+    python quantile_sketch.py show sketches/2024-01-15.json sketches/2024-01-16.json --dim domain -k 10
+    python quantile_sketch.py merge week.json sketches/2024-01-1*.json
+"""
+import argparse
+import json
+import math
+import os
+
+from aggregator import SpaceSaving
+
+RELATIVE_ACCURACY = 0.01
+METRICS = ("duration_s", "speed_mbps", "size_kb")
+DIMENSIONS = ("ip", "domain", "asn")
+QUANTILES = (0.5, 0.9, 0.99)
+# Records whose ISP lookup is pending wait this long (at most this many) for their ASN sketch
+PENDING_SECONDS = 300
+PENDING_MAX = 100000
+# Keys evicted by a capped SketchSet are merged into this one
+OTHER_KEY = "(other)"
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+class QuantileSketch:
+    """Counts per log bucket; values <= 0 are counted separately as zeros."""
+    __slots__ = ("bins", "zeros", "count")
+
+    def __init__(self):
+        self.bins = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value > 0:
+            index = math.ceil(math.log(value) / _LOG_GAMMA)
+            self.bins[index] = self.bins.get(index, 0) + 1
+        else:
+            self.zeros += 1
+
+    def merge(self, other):
+        bins = self.bins
+        for index, count in other.bins.items():
+            bins[index] = bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """The q-quantile (0 <= q <= 1) within RELATIVE_ACCURACY; 0.0 when empty."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * _GAMMA ** index / (_GAMMA + 1)
+        return 2 * _GAMMA ** max(self.bins) / (_GAMMA + 1)
+
+    def quantiles(self, qs=QUANTILES):
+        return [self.quantile(q) for q in qs]
+
+    def to_dict(self):
+        return {"zeros": self.zeros, "bins": sorted(self.bins.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.bins = {int(index): int(count) for index, count in data["bins"]}
+        sketch.zeros = int(data["zeros"])
+        sketch.count = sketch.zeros + sum(sketch.bins.values())
+        return sketch
+
+
+class SketchSet:
+    """A QuantileSketch per metric for every IP, domain and ASN seen.
+
+    `add(record)` updates 3 dimensions x 3 metrics in constant time; the
+    bucket index of each metric is computed once and shared by the dimensions.
+    A record whose ISP is still pending (None) gets its ASN sketches from
+    add_pending() once the resolver has filled it in; failed lookups (the
+    IP itself) are left out of the ASN dimension.
+
+    With `max_keys`, each dimension keeps sketches only for the keys a
+    Space-Saving counter of records tracks; an evicted key's sketches are
+    merged into OTHER_KEY, so memory stays bounded under key churn.
+    """
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys
+        self._sketches = {dim: {} for dim in DIMENSIONS}  # dim -> key -> (sketch per metric)
+        self._dims = [self._sketches[dim] for dim in DIMENSIONS]
+        self._counters = [SpaceSaving(max_keys) if max_keys else None for _ in DIMENSIONS]
+        self._pending = []  # records added before their ISP was known
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._sketches.values())
+
+    def add(self, record):
+        indices = _indices(record)
+        isp = record.isp
+        if isp is None:
+            self._pending.append(record)
+        elif isp == record.ip:
+            isp = None
+        for dim, key in enumerate((record.ip, record.domain, isp)):
+            if key is not None:
+                self._add(dim, key, indices)
+
+    def _add(self, dim, key, indices):
+        keys = self._dims[dim]
+        counter = self._counters[dim]
+        if counter is not None:
+            evicted = counter.add(key, 1)
+            if evicted is not None:
+                _retire(keys, evicted)
+        _add_indices(keys, key, indices)
+
+    def add_pending(self, now):
+        """Add the ASN sketches of pending records whose ISP is now known.
+
+        Records still pending after PENDING_SECONDS are dropped.
+        """
+        if not self._pending:
+            return
+        asn = DIMENSIONS.index("asn")
+        oldest = now - PENDING_SECONDS
+        pending = []
+        for record in self._pending:
+            isp = record.isp
+            if isp is None:
+                if record.timestamp >= oldest:
+                    pending.append(record)
+            elif isp != record.ip:
+                self._add(asn, isp, _indices(record))
+        self._pending = pending[-PENDING_MAX:]
+
+    def get(self, dim, key, metric):
+        """The sketch of one metric for one key, or None if the key was not seen."""
+        sketches = self._sketches[dim].get(key)
+        return sketches[METRICS.index(metric)] if sketches is not None else None
+
+    def quantiles(self, dim, key, metric, qs=QUANTILES):
+        sketch = self.get(dim, key, metric)
+        return sketch.quantiles(qs) if sketch is not None else None
+
+    def keys(self, dim):
+        """Keys of a dimension, most records first."""
+        sketches = self._sketches[dim]
+        return sorted(sketches, key=lambda key: sketches[key][0].count, reverse=True)
+
+    def merge(self, other):
+        for dim, keys in other._sketches.items():
+            mine = self._sketches[dim]
+            for key, sketches in keys.items():
+                if key in mine:
+                    for sketch, theirs in zip(mine[key], sketches):
+                        sketch.merge(theirs)
+                else:
+                    mine[key] = tuple(QuantileSketch().merge(s) for s in sketches)
+        return self
+
+    def clear(self):
+        for keys in self._sketches.values():
+            keys.clear()
+        self._counters = [SpaceSaving(self.max_keys) if self.max_keys else None for _ in DIMENSIONS]
+        self._pending = []
+
+    def take(self):
+        """Move the sketches into a new SketchSet and start this one over; pending records are dropped."""
+        taken = SketchSet(self.max_keys)
+        taken._sketches, self._sketches = self._sketches, taken._sketches
+        taken._dims, self._dims = self._dims, taken._dims
+        taken._counters, self._counters = self._counters, taken._counters
+        self._pending = []
+        return taken
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": RELATIVE_ACCURACY,
+            "sketches": {
+                dim: {key: {metric: s.to_dict() for metric, s in zip(METRICS, sketches)} for key, sketches in keys.items()}
+                for dim, keys in self._sketches.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("relative_accuracy") != RELATIVE_ACCURACY:
+            raise ValueError(f"sketches use relative accuracy {data.get('relative_accuracy')}, expected {RELATIVE_ACCURACY}")
+        sketch_set = cls()
+        for dim, keys in data["sketches"].items():
+            sketch_set._sketches[dim].update(
+                (key, tuple(QuantileSketch.from_dict(metrics[metric]) for metric in METRICS))
+                for key, metrics in keys.items()
+            )
+        return sketch_set
+
+
+def _indices(record):
+    return [
+        math.ceil(math.log(value) / _LOG_GAMMA) if value > 0 else None
+        for value in (record.duration_s, record.speed_mbps, record.size_kb)
+    ]
+
+
+def _retire(keys, key):
+    """Merge the sketches of `key` into OTHER_KEY."""
+    sketches = keys.pop(key, None)
+    if sketches is None:
+        return
+    other = keys.get(OTHER_KEY)
+    if other is None:
+        keys[OTHER_KEY] = sketches
+    else:
+        for sketch, retired in zip(other, sketches):
+            sketch.merge(retired)
+
+
+def _add_indices(keys, key, indices):
+    sketches = keys.get(key)
+    if sketches is None:
+        sketches = keys[key] = (QuantileSketch(), QuantileSketch(), QuantileSketch())
+    for sketch, index in zip(sketches, indices):
+        sketch.count += 1
+        if index is None:
+            sketch.zeros += 1
+        else:
+            bins = sketch.bins
+            bins[index] = bins.get(index, 0) + 1
+
+
+def load_sketches(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return SketchSet.from_dict(json.load(f))
+
+
+def save_sketches(sketch_set, path):
+    """Write `sketch_set` to `path`, merged into the sketches already there."""
+    merged = SketchSet()
+    if os.path.exists(path):
+        try:
+            merged = load_sketches(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Fail to read sketches {path}, moving it to {path}.bad: {e}")
+            os.replace(path, path + ".bad")
+    merged.merge(sketch_set)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(merged.to_dict(), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or merge saved percentile sketches")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show = sub.add_parser("show")
+    show.add_argument("paths", nargs="+")
+    show.add_argument("--dim", choices=DIMENSIONS, default="domain")
+    show.add_argument("-k", type=int, default=20)
+
+    merge = sub.add_parser("merge")
+    merge.add_argument("output")
+    merge.add_argument("paths", nargs="+")
+
+    args = parser.parse_args(argv)
+    merged = SketchSet()
+    for path in args.paths:
+        merged.merge(load_sketches(path))
+
+    if args.command == "merge":
+        save_sketches(merged, args.output)
+        print(f"Merged {len(args.paths)} files into {args.output}")
+        return
+
+    print(f"{'':40s} {'count':>8s}  {'duration p50/p90/p99 (s)':>26s}  {'speed p50/p90/p99 (Mbps)':>26s}  {'size p50/p90/p99 (KB)':>26s}")
+    for key in merged.keys(args.dim)[:args.k]:
+        count = merged.get(args.dim, key, "duration_s").count
+        columns = []
+        for metric, digits in zip(METRICS, (3, 1, 0)):
+            columns.append("/".join(f"{v:.{digits}f}" for v in merged.quantiles(args.dim, key, metric)))
+        print(f"{key[:40]:40s} {count:8d}  {columns[0]:>26s}  {columns[1]:>26s}  {columns[2]:>26s}")
+
+
+if __name__ == "__main__":
+    main()
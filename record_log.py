@@ -0,0 +1,213 @@
+import datetime
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+
+def encode_record(record):
+    return json.dumps(record.to_dict())
+
+
+class _Command:
+    __slots__ = ("name", "done")
+
+    def __init__(self, name):
+        self.name = name
+        self.done = threading.Event()
+
+
+class JsonlSink:
+    """JSONL log file, rotated once it exceeds `max_bytes` or is older than
+    `rotate_interval` seconds (0 disables either). Closed segments can be
+    gzip-compressed."""
+    def __init__(self, path, max_bytes=0, rotate_interval=0, compress=False, encoder=encode_record):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.encoder = encoder
+        self._segments = []  # closed segments of this session, oldest first
+        self._segments_lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def write_batch(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.encoder(record) + "\n")
+            except Exception as e:
+                print(f"Fail to encode record: {e}")
+        self._file.write("".join(lines))
+        self._file.flush()
+        if self._should_rotate():
+            self._rotate()
+        return len(lines)
+
+    def segments(self):
+        """Paths of this session's log segments, oldest first."""
+        with self._segments_lock:
+            return self._segments + [self.path]
+
+    def clear(self):
+        self._file.close()
+        with self._segments_lock:
+            segments, self._segments = self._segments, []
+        for segment in segments:
+            try:
+                os.remove(segment)
+            except OSError:
+                pass
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def close(self):
+        self._file.close()
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        if self.rotate_interval and time.monotonic() - self._opened_at >= self.rotate_interval:
+            return self._file.tell() > 0
+        return False
+
+    def _rotate(self):
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        segment = f"{root}.{stamp}{ext}"
+        counter = 1
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            segment = f"{root}.{stamp}_{counter}{ext}"
+            counter += 1
+        os.replace(self.path, segment)
+
+        if self.compress:
+            try:
+                with open(segment, "rb") as src, gzip.open(segment + ".gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(segment)
+                segment += ".gz"
+            except OSError as e:
+                print(f"Fail to compress {segment}: {e}")
+
+        with self._segments_lock:
+            self._segments.append(segment)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+
+class RecordWriter:
+    """Hand records to a sink from a dedicated writer thread.
+
+    Records are group-committed: one write + flush per batch of `batch_size`
+    records or every `flush_interval` seconds, whichever comes first. The sink
+    (JsonlSink or record_store.BinaryRecordStore) keeps its file open between
+    batches. Flush, clear and close are queued behind pending records, so
+    they are ordered with respect to the writes.
+    """
+    def __init__(self, sink, batch_size=100, flush_interval=0.25):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records_written = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="record-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self._queue.put(record)
+
+    def backlog(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=10):
+        """Block until every record queued so far is on disk."""
+        return self._command("flush", timeout)
+
+    def clear(self, timeout=10):
+        """Drop pending records and truncate the sink."""
+        return self._command("clear", timeout)
+
+    def close(self, timeout=10):
+        """Write out everything still queued and stop the writer thread."""
+        if self._closed:
+            return True
+        self._closed = True
+        done = self._command("close", timeout)
+        self._thread.join(timeout)
+        return done
+
+    def segments(self):
+        return self.sink.segments()
+
+    def _command(self, name, timeout):
+        if not self._thread.is_alive():
+            return False
+        command = _Command(name)
+        self._queue.put(command)
+        return command.done.wait(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None:
+                self._write_batch(batch)
+                batch = []
+            elif isinstance(item, _Command):
+                if item.name == "clear":
+                    batch = []
+                    self._call(self.sink.clear)
+                else:
+                    self._write_batch(batch)
+                    batch = []
+                if item.name == "close":
+                    self._call(self.sink.close)
+                    item.done.set()
+                    return
+                item.done.set()
+            else:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch)
+                    batch = []
+
+    def _write_batch(self, batch):
+        if batch:
+            written = self._call(self.sink.write_batch, batch)
+            self.records_written += written or 0
+
+    def _call(self, method, *args):
+        try:
+            return method(*args)
+        except OSError as e:
+            print(f"Fail to write records: {e}")
+
+
+def iter_log_records(paths):
+    """Yield record dicts from JSONL log segments (plain or .gz), skipping bad lines."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,300 @@
+"""Fixed-width binary record store, read back as a memory-mapped NumPy array.
+
+Each record is 36 bytes (see RECORD_DTYPE): epoch timestamp, size, duration,
+speed and interned ids for IP, domain, ISP/ASN and source browser. Stores
+written before the source field (NMREC001) are still readable. The strings behind the ids
+live in a sidecar ``<path>.strings`` file, one per line, id = line number.
+
+Convert to and from the JSONL log:
+    python record_store.py to-binary responses.jsonl responses.nmrec
+    python record_store.py to-jsonl responses.nmrec responses.jsonl
+"""
+import argparse
+import datetime
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+from record_log import iter_log_records
+
+MAGIC = b"NMREC002"
+MAGIC_V1 = b"NMREC001"
+HEADER_SIZE = 32
+RECORD = struct.Struct("<dfffIIII")
+RECORD_DTYPE_V1 = np.dtype([
+    ("time", "<f8"),
+    ("size_kb", "<f4"),
+    ("duration_s", "<f4"),
+    ("speed_mbps", "<f4"),
+    ("ip", "<u4"),
+    ("domain", "<u4"),
+    ("isp", "<u4"),
+])
+RECORD_DTYPE = np.dtype(RECORD_DTYPE_V1.descr + [("source", "<u4")])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+class RecordTable:
+    """A structured record array plus the string table its ids refer to."""
+    def __init__(self, records, strings):
+        self.records = records
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.records)
+
+    def iter_dicts(self):
+        """Yield records in the JSONL log format."""
+        strings = self.strings
+        for t, size_kb, duration_s, speed_mbps, ip, domain, isp, source in self.records.tolist():
+            ip = strings[ip]
+            yield {
+                "time": datetime.datetime.fromtimestamp(t).strftime("%H:%M:%S"),
+                "size_kb": round(size_kb, 2),
+                "duration_s": round(duration_s, 3),
+                "speed_mbps": round(speed_mbps, 2),
+                "ip": ip,
+                "domain": strings[domain],
+                "as": strings[isp] or ip,
+                "source": strings[source]
+            }
+
+    def fill_isp(self, lookup):
+        """Fill in the ISP of records stored while their lookup was pending.
+
+        `lookup(ip)` returns the ISP, or None while it is still unknown. The
+        records are copied (they may be a read-only memmap) only when an ISP
+        is filled in; otherwise the table itself is returned.
+        """
+        records = self.records
+        pending = records["isp"] == 0
+        if not pending.any():
+            return self
+        strings = list(self.strings)
+        ids = {value: idx for idx, value in enumerate(strings)}
+        isp_of_ip = np.zeros(len(strings), dtype=records.dtype["isp"])
+        for ip in np.unique(records["ip"][pending]).tolist():
+            isp = lookup(strings[ip]) if ip else None
+            if not isp:
+                continue
+            idx = ids.get(isp)
+            if idx is None:
+                idx = ids[isp] = len(strings)
+                strings.append(isp)
+            isp_of_ip[ip] = idx
+        if not isp_of_ip.any():
+            return self
+        records = np.array(records)
+        records["isp"][pending] = isp_of_ip[records["ip"][pending]]
+        return RecordTable(records, strings)
+
+    @classmethod
+    def from_dicts(cls, records, date=None):
+        """Build a table from JSONL-style dicts.
+
+        The log only stores "HH:MM:SS", so times are placed on `date`
+        (default: today), as the UI has always done.
+        """
+        date = date or datetime.date.today()
+        strings = [""]
+        ids = {"": 0}
+
+        def intern(value):
+            value = value or ""
+            idx = ids.get(value)
+            if idx is None:
+                idx = ids[value] = len(strings)
+                strings.append(value)
+            return idx
+
+        rows = []
+        for record in records:
+            try:
+                t = datetime.datetime.combine(
+                    date, datetime.datetime.strptime(record["time"], "%H:%M:%S").time()
+                ).timestamp()
+                rows.append((
+                    t,
+                    record.get("size_kb", 0),
+                    record.get("duration_s", 0),
+                    record.get("speed_mbps", 0),
+                    intern(record.get("ip", "")),
+                    intern(record.get("domain", "unknown")),
+                    intern(record.get("as", "")),
+                    intern(record.get("source", ""))
+                ))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return cls(np.array(rows, dtype=RECORD_DTYPE), strings)
+
+
+class BinaryRecordStore:
+    """Append-only binary record file; usable as a RecordWriter sink."""
+    def __init__(self, path, truncate=False):
+        self.path = path
+        self.strings_path = path + ".strings"
+        self._lock = threading.Lock()
+        self._strings = []
+        self._ids = {}
+        self._open(truncate)
+
+    def _open(self, truncate):
+        if truncate or not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
+            with open(self.path, "wb") as f:
+                f.write(MAGIC.ljust(HEADER_SIZE, b"\x00"))
+            with open(self.strings_path, "w", encoding="utf-8"):
+                pass
+        else:
+            with open(self.path, "rb") as f:
+                magic = f.read(len(MAGIC))
+            if magic == MAGIC_V1:
+                raise ValueError(f"{self.path} has no source field, convert it with to-jsonl and to-binary first")
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a record store")
+            # Drop a partially written trailing record
+            size = os.path.getsize(self.path)
+            excess = (size - HEADER_SIZE) % RECORD.size
+            if excess:
+                os.truncate(self.path, size - excess)
+
+        self._strings = []
+        self._ids = {}
+        with open(self.strings_path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._add_string(line.rstrip("\n"))
+
+        self._file = open(self.path, "ab")
+        self._strings_file = open(self.strings_path, "a", encoding="utf-8")
+        if not self._strings:
+            self.intern("")
+            self._strings_file.flush()
+
+    def _add_string(self, value):
+        idx = len(self._strings)
+        self._strings.append(value)
+        self._ids[value] = idx
+        return idx
+
+    def intern(self, value):
+        value = (value or "").replace("\n", " ")
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = self._add_string(value)
+            self._strings_file.write(value + "\n")
+        return idx
+
+    def write_batch(self, batch):
+        with self._lock:
+            intern = self.intern
+            data = b"".join(
+                RECORD.pack(
+                    record.timestamp,
+                    record.size_kb,
+                    record.duration_s,
+                    record.speed_mbps,
+                    intern(record.ip),
+                    intern(record.domain),
+                    intern(record.isp),
+                    intern(record.source)
+                )
+                for record in batch
+            )
+            # Strings first, so every id on disk can be resolved
+            self._strings_file.flush()
+            self._file.write(data)
+            self._file.flush()
+        return len(batch)
+
+    def segments(self):
+        return [self.path]
+
+    def clear(self):
+        with self._lock:
+            self.close()
+            self._open(truncate=True)
+
+    def close(self):
+        self._file.close()
+        self._strings_file.close()
+
+    def read_table(self):
+        """Zero-copy view of the records written so far."""
+        # Count and strings from the same point, so every mapped id can be resolved
+        with self._lock:
+            strings = list(self._strings)
+            count = (os.path.getsize(self.path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        return load_table(self.path, strings, count)
+
+
+def load_table(path, strings=None, count=None):
+    """Memory-map a record store file as a RecordTable.
+
+    `count` limits the view to the first records, e.g. the ones written when
+    `strings` was read; by default every complete record is mapped.
+    """
+    if strings is None:
+        with open(path + ".strings", "r", encoding="utf-8") as f:
+            strings = [line.rstrip("\n") for line in f]
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    dtype = RECORD_DTYPE_V1 if magic == MAGIC_V1 else RECORD_DTYPE
+    if count is None:
+        count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if count <= 0:
+        return RecordTable(np.zeros(0, dtype=RECORD_DTYPE), strings)
+    records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+    if dtype is RECORD_DTYPE_V1:
+        # No source column yet: copy into the current layout with source "" (id 0)
+        upgraded = np.zeros(count, dtype=RECORD_DTYPE)
+        for name in RECORD_DTYPE_V1.names:
+            upgraded[name] = records[name]
+        records = upgraded
+    return RecordTable(records, strings)
+
+
+def jsonl_to_binary(jsonl_path, store_path, date=None):
+    table = RecordTable.from_dicts(iter_log_records([jsonl_path]), date)
+    with open(store_path, "wb") as f:
+        f.write(MAGIC.ljust(HEADER_SIZE, b"\x00"))
+        f.write(table.records.tobytes())
+    with open(store_path + ".strings", "w", encoding="utf-8") as f:
+        for value in table.strings:
+            f.write(value.replace("\n", " ") + "\n")
+    return len(table)
+
+
+def binary_to_jsonl(store_path, jsonl_path):
+    table = load_table(store_path)
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for record in table.iter_dicts():
+            f.write(json.dumps(record) + "\n")
+    return len(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert between the JSONL log and the binary record store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    to_binary = sub.add_parser("to-binary")
+    to_binary.add_argument("source")
+    to_binary.add_argument("target")
+    to_binary.add_argument("--date", default=None, help="date of the log (YYYY-MM-DD), default today")
+
+    to_jsonl = sub.add_parser("to-jsonl")
+    to_jsonl.add_argument("source")
+    to_jsonl.add_argument("target")
+
+    args = parser.parse_args(argv)
+    if args.command == "to-binary":
+        date = datetime.date.fromisoformat(args.date) if args.date else None
+        count = jsonl_to_binary(args.source, args.target, date)
+    else:
+        count = binary_to_jsonl(args.source, args.target)
+    print(f"Converted {count} records to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import time
+from types import SimpleNamespace
+
+from timeseries_store import TimeSeriesStore
+
+
+def make_records(start, seconds, step=10):
+    return [
+        SimpleNamespace(
+            timestamp=start + offset, size_kb=100.0, duration_s=0.1, speed_mbps=8.0,
+            ip="10.0.0.1", domain="example.com", isp="Example ISP", source=""
+        )
+        for offset in range(0, seconds, step)
+    ]
+
+
+def test_short_range_after_prune_reads_coarser_tier(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "traffic.sqlite"))
+    try:
+        base = int(time.time()) // 3600 * 3600 - 3 * 24 * 3600
+        store.write_batch(make_records(base, 3600))
+        store.prune()
+
+        # 30 minutes three days ago: the 1 s tier is gone, the 1 min tier still has it
+        assert store.tier(base + 600, base + 2400) == ("1m", 60)
+        size, lines = store.envelope("domain", base + 600, base + 2400, 1000)
+        assert size == 60
+        assert [key for key, _, _ in lines] == ["example.com"]
+        assert lines[0][2].max() == 8.0
+
+        top = store.top("domain", base + 600, base + 2400)
+        assert top[0][0] == "example.com"
+        assert top[0][2] == 180
+    finally:
+        store.close()
+
+
+def test_recent_range_reads_finest_tier(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "traffic.sqlite"))
+    try:
+        now = time.time()
+        assert store.tier(now - 600, now) == ("1s", 1)
+        assert store.tier(now - 7 * 24 * 3600, now) == ("1h", 3600)
+    finally:
+        store.close()
@@ -0,0 +1,332 @@
+"""Persistent SQLite record store with 1 s, 1 min and 1 h rollups.
+
+Raw records are kept next to per-bucket rollups for each IP, domain and ASN
+(bytes, count, speed sum and max), so range and top-K queries over weeks of
+data read a few thousand rollup rows instead of every record. Each tier has
+its own retention, and the history is kept across sessions. Strings are
+interned into the `strings` table, so read_table() returns the same
+RecordTable the exports use for the other formats.
+
+    python timeseries_store.py top traffic.sqlite --dim domain --hours 24
+    python timeseries_store.py prune traffic.sqlite
+"""
+import argparse
+import datetime
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from aggregator import downsample_minmax
+from record_store import RECORD_DTYPE, RecordTable
+
+TIERS = (("1s", 1), ("1m", 60), ("1h", 3600))
+DIMENSIONS = ("ip", "domain", "asn")
+# Seconds each table is kept (0 = forever)
+DEFAULT_RETENTION = {"raw": 7 * 24 * 3600, "1s": 24 * 3600, "1m": 90 * 24 * 3600, "1h": 0}
+PRUNE_INTERVAL = 60
+# Records whose ISP lookup is pending wait this long (at most this many) for their ASN rollup
+PENDING_ASN_SECONDS = 300
+PENDING_ASN_MAX = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strings (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS records (
+    time REAL NOT NULL, size_kb REAL, duration_s REAL, speed_mbps REAL,
+    ip INTEGER, domain INTEGER, isp INTEGER, source INTEGER
+);
+CREATE INDEX IF NOT EXISTS records_time ON records (time);
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{tier} (
+    dim INTEGER NOT NULL, key INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    bytes_kb REAL NOT NULL, count INTEGER NOT NULL, speed_sum REAL NOT NULL, speed_max REAL NOT NULL,
+    PRIMARY KEY (dim, bucket, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollup_{tier}_key ON rollup_{tier} (dim, key, bucket);
+"""
+
+UPSERT = """
+INSERT INTO rollup_{tier} (dim, key, bucket, bytes_kb, count, speed_sum, speed_max) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dim, bucket, key) DO UPDATE SET
+    bytes_kb = bytes_kb + excluded.bytes_kb,
+    count = count + excluded.count,
+    speed_sum = speed_sum + excluded.speed_sum,
+    speed_max = max(speed_max, excluded.speed_max)
+"""
+
+
+def tier_for(seconds, max_buckets=2000, age=0, retention=None):
+    """The finest tier that covers `seconds` in at most `max_buckets` buckets.
+
+    With `retention`, tiers that no longer keep data `age` seconds old are
+    skipped, so a short range in the past falls back to a coarser tier.
+    """
+    for name, size in TIERS:
+        kept = retention.get(name, 0) if retention else 0
+        if seconds / size <= max_buckets and (not kept or age <= kept):
+            return name, size
+    return TIERS[-1]
+
+
+class TimeSeriesStore:
+    """SQLite record store; usable as a RecordWriter sink.
+
+    Writes come from the writer thread. Queries open their own connection per
+    thread, and WAL mode lets them run alongside the writes. clear() starts a
+    new session for read_table() but keeps the history.
+
+    A record whose ISP lookup is still pending is stored without an ISP and
+    left out of the ASN rollups. The resolver fills in `record.isp` later,
+    and a following write_batch() then rolls it up under its ASN and sets
+    the ISP of the raw rows of that IP. Failed lookups (the IP itself) are
+    never rolled up as an ASN.
+    """
+    def __init__(self, path, retention=None):
+        self.path = path
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self._local = threading.local()
+        self._ids = {}
+        self._last_prune = 0.0
+        self._pending_asn = []  # records written before their ISP was known
+        self._db = self._connect()
+        self._db.executescript(SCHEMA + "".join(ROLLUP_SCHEMA.format(tier=tier) for tier, _ in TIERS))
+        self._db.execute("INSERT OR IGNORE INTO strings (id, value) VALUES (0, '')")
+        self._db.commit()
+        for idx, value in self._db.execute("SELECT id, value FROM strings"):
+            self._ids[value] = idx
+        self.clear()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def intern(self, value):
+        value = value or ""
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = self._db.execute("INSERT INTO strings (value) VALUES (?)", (value,)).lastrowid
+            self._ids[value] = idx
+        return idx
+
+    def write_batch(self, batch):
+        intern = self.intern
+        rows = []
+        rollups = {}  # (tier, dim, key, bucket) -> [bytes, count, speed sum, speed max]
+
+        def roll_up(record, dim, key):
+            sec = int(record.timestamp)
+            for tier, size in TIERS:
+                slot = (tier, dim, key, sec - sec % size)
+                acc = rollups.get(slot)
+                if acc is None:
+                    rollups[slot] = [record.size_kb, 1, record.speed_mbps, record.speed_mbps]
+                else:
+                    acc[0] += record.size_kb
+                    acc[1] += 1
+                    acc[2] += record.speed_mbps
+                    if record.speed_mbps > acc[3]:
+                        acc[3] = record.speed_mbps
+
+        try:
+            pending = []
+            resolved = {}  # (ip id, isp id) -> earliest time, for the raw rows written while pending
+            oldest = time.time() - PENDING_ASN_SECONDS
+            for record in self._pending_asn:
+                if record.isp is not None:
+                    isp = intern(record.isp)
+                    key = (intern(record.ip), isp)
+                    resolved[key] = min(resolved.get(key, record.timestamp), record.timestamp)
+                    if record.isp != record.ip:
+                        roll_up(record, 2, isp)
+                elif record.timestamp >= oldest:
+                    pending.append(record)
+
+            for record in batch:
+                # Read once: the resolver may fill it in while the batch is written
+                isp_name = record.isp
+                ip = intern(record.ip)
+                domain = intern(record.domain)
+                isp = intern(isp_name)
+                rows.append((
+                    record.timestamp, record.size_kb, record.duration_s, record.speed_mbps,
+                    ip, domain, isp, intern(getattr(record, "source", ""))
+                ))
+                roll_up(record, 0, ip)
+                roll_up(record, 1, domain)
+                if isp_name is None:
+                    pending.append(record)
+                elif isp_name != record.ip:
+                    roll_up(record, 2, isp)
+
+            with self._db:
+                self._db.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.executemany(
+                    "UPDATE records SET isp = ? WHERE ip = ? AND isp = 0 AND time >= ?",
+                    [(isp, ip, since) for (ip, isp), since in resolved.items()]
+                )
+                for tier, _ in TIERS:
+                    self._db.executemany(UPSERT.format(tier=tier), [
+                        (dim, key, bucket, *acc) for (t, dim, key, bucket), acc in rollups.items() if t == tier
+                    ])
+        except sqlite3.Error as e:
+            # Ids interned in the failed transaction are gone
+            self._ids = {value: idx for idx, value in self._db.execute("SELECT id, value FROM strings")}
+            print(f"Fail to write records: {e}")
+            return 0
+        self._pending_asn = pending[-PENDING_ASN_MAX:]
+
+        now = time.time()
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune(now)
+        return len(rows)
+
+    def prune(self, now=None):
+        """Delete whatever is older than its table's retention."""
+        now = time.time() if now is None else now
+        try:
+            with self._db:
+                if self.retention["raw"]:
+                    self._db.execute("DELETE FROM records WHERE time < ?", (now - self.retention["raw"],))
+                for tier, _ in TIERS:
+                    if self.retention[tier]:
+                        self._db.execute(f"DELETE FROM rollup_{tier} WHERE bucket < ?", (int(now - self.retention[tier]),))
+        except sqlite3.Error as e:
+            print(f"Fail to prune store: {e}")
+
+    def segments(self):
+        return [self.path]
+
+    def clear(self):
+        """Start a new session: read_table() only returns records written from now on."""
+        self._session_row = self._db.execute("SELECT IFNULL(MAX(rowid), 0) FROM records").fetchone()[0]
+
+    def close(self):
+        if self._pending_asn:
+            # Roll up whatever was resolved since the last batch
+            self.write_batch([])
+        self._db.close()
+
+    def strings(self):
+        rows = self._reader().execute("SELECT id, value FROM strings").fetchall()
+        strings = [""] * (max((idx for idx, _ in rows), default=0) + 1)
+        for idx, value in rows:
+            strings[idx] = value
+        return strings
+
+    def read_table(self, start=None, end=None):
+        """Raw records in [start, end) as a RecordTable; without a range, this session's records."""
+        columns = "SELECT time, size_kb, duration_s, speed_mbps, ip, domain, isp, source FROM records"
+        if start is None and end is None:
+            cursor = self._reader().execute(f"{columns} WHERE rowid > ? ORDER BY time", (self._session_row,))
+        else:
+            cursor = self._reader().execute(
+                f"{columns} WHERE time >= ? AND time < ? ORDER BY time",
+                (start or 0, float("inf") if end is None else end)
+            )
+        records = np.array(cursor.fetchall(), dtype=RECORD_DTYPE)
+        return RecordTable(records, self.strings())
+
+    def tier(self, start, end, max_buckets=2000):
+        """(name, seconds) of the tier to read [start, end) from; see tier_for()."""
+        return tier_for(end - start, max_buckets, time.time() - start, self.retention)
+
+    def top(self, dim, start, end, k=10, by="bytes", tier=None):
+        """[(key, total MB, count, avg Mbps, max Mbps)] for the `k` biggest keys of a dimension in [start, end)."""
+        tier = tier or self.tier(start, end)[0]
+        order = "SUM(bytes_kb)" if by == "bytes" else "MAX(speed_max)"
+        rows = self._reader().execute(
+            f"SELECT s.value, SUM(bytes_kb), SUM(count), SUM(speed_sum), MAX(speed_max)"
+            f" FROM rollup_{tier} r JOIN strings s ON s.id = r.key"
+            f" WHERE dim = ? AND bucket >= ? AND bucket < ? GROUP BY key ORDER BY {order} DESC LIMIT ?",
+            (DIMENSIONS.index(dim), int(start), int(end), k)
+        ).fetchall()
+        return [(key, kb / 1024, count, speed_sum / count, speed_max) for key, kb, count, speed_sum, speed_max in rows]
+
+    def series(self, dim, key, start, end, tier=None):
+        """(bucket starts, MB, max Mbps) arrays of one key in [start, end)."""
+        tier = tier or self.tier(start, end)[0]
+        key_id = self._ids.get(key)
+        if key_id is None:
+            row = self._reader().execute("SELECT id FROM strings WHERE value = ?", (key,)).fetchone()
+            if row is None:
+                return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+            key_id = row[0]
+        rows = self._reader().execute(
+            f"SELECT bucket, bytes_kb, speed_max FROM rollup_{tier}"
+            f" WHERE dim = ? AND key = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (DIMENSIONS.index(dim), key_id, int(start), int(end))
+        ).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        buckets, kb, speed_max = zip(*rows)
+        return np.array(buckets, dtype=np.int64), np.array(kb) / 1024, np.array(speed_max)
+
+    def envelope(self, dim, start, end, width, k=3, combine="max"):
+        """The top `k` keys of [start, end) at the level of detail of a `width` pixel plot.
+
+        Reads the finest tier with at most two buckets per pixel that still
+        holds `start` (see tier()), fills idle buckets with 0 and keeps one
+        min/max pair per pixel column. Values are the max speed per bucket,
+        or with `combine="sum"` the average throughput (bytes over bucket
+        length). Returns (bucket seconds, [(key, times, Mbps)]).
+        """
+        width = max(1, int(width))
+        tier, size = self.tier(start, end, max_buckets=2 * width)
+        first = int(start) // size * size
+        last = int(end) // size * size
+        times = np.arange(first, last + size, size, dtype=np.float64)
+        lines = []
+        for key, *_ in self.top(dim, first, last + size, k, tier=tier):
+            buckets, mb, speed_max = self.series(dim, key, first, last + size, tier)
+            values = np.zeros(len(times))
+            slots = (buckets - first) // size
+            values[slots] = mb * 1024 * 8 / 1000 / size if combine == "sum" else speed_max
+            x, y = downsample_minmax(times, values, 2 * width)
+            lines.append((key, x, y))
+        return size, lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or prune the SQLite record store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    top = sub.add_parser("top")
+    top.add_argument("path")
+    top.add_argument("--dim", choices=DIMENSIONS, default="domain")
+    top.add_argument("--hours", type=float, default=24)
+    top.add_argument("-k", type=int, default=10)
+    top.add_argument("--by", choices=("bytes", "peak"), default="bytes")
+
+    prune = sub.add_parser("prune")
+    prune.add_argument("path")
+
+    args = parser.parse_args(argv)
+    store = TimeSeriesStore(args.path)
+    try:
+        if args.command == "top":
+            end = time.time()
+            start = end - args.hours * 3600
+            print(f"Top {args.dim} since {datetime.datetime.fromtimestamp(start):%Y-%m-%d %H:%M}")
+            for key, mb, count, avg_speed, max_speed in store.top(args.dim, start, end, args.k, args.by):
+                print(f"{key:40s} {mb:10.2f} MB {count:8d} req  avg {avg_speed:8.2f}  max {max_speed:8.2f} Mbps")
+        else:
+            store.prune()
+            print(f"Pruned {args.path}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()